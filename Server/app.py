@@ -1,11 +1,36 @@
-from config import app, db, current_user, get_jwt, set_access_cookies, create_access_token, jwt_required, jwt, datetime, timedelta, timezone, request, make_response, jsonify, Resource, api, get_jwt_identity
+from config import app, db, current_user, get_jwt, set_access_cookies, create_access_token, jwt_required, jwt, datetime, timedelta, timezone, request, make_response, jsonify, Resource, api, get_jwt_identity, Response, stream_with_context, select, StaleDataError
 from models import User, TokenBlocklist, Product, ProductCategory, Order, OrderItem, Review, Address, Notification, Cart, CartItem
+from cache import product_cache, catalog_cache
+from versions import bump_versions, current_versions, make_etag, table_etag, not_modified, tagged_response
+from search import build_match, search_products
+from bulk import RowError, parse_rows, import_products, update_products
+from projection import FieldError, PRODUCT_COLUMNS, ORDER_COLUMNS, REVIEW_COLUMNS, ADDRESS_COLUMNS, parse_fields, row_to_dict
+from catalog import CatalogError, CatalogQuery, page_params, page_size, parse_expand, detail_to_dict, product_detail
+from ratings import is_valid_rating, counts_toward_rating, apply_rating
+from revocation import revoked_tokens
+from principals import LazyPrincipal
+from passwords import PasswordPoolSaturated, needs_rehash
+from orders import OrderError, parse_lines, parse_reservation_ids, place_order, order_history
+from reservations import ReservationError, reserve, release
+from sales import ReportError, record_order, unrecord_order, sales_report
+from outbox import emit
+from idempotency import idempotent
+from cart import checkout_cart
+from cart_store import cart_store
+from inbox import InboxError, unread_count, inbox_page, mark_read
+from live import StreamLimitReached, notification_hub, notification_events
+import retention  # registers the retention command and background job
 
 
 @jwt.user_lookup_loader
 def user_lookup_callback(_jwt_header, jwt_data):
-    identity = jwt_data["sub"]
-    return User.query.filter_by(username=identity).one_or_none()
+    return LazyPrincipal(_jwt_header, jwt_data)
+
+@app.errorhandler(PasswordPoolSaturated)
+def password_pool_saturated(error):
+    response = make_response(jsonify({"error": "The server is busy, please try again shortly."}), 503)
+    response.headers['Retry-After'] = '1'
+    return response
 
 @app.after_request
 def refresh_expiring_jwts(response):
@@ -22,9 +47,10 @@ def refresh_expiring_jwts(response):
 
 @jwt.token_in_blocklist_loader
 def check_if_token_revoked(jwt_header, jwt_payload: dict) -> bool:
-    jti = jwt_payload["jti"]
-    token = db.session.query(TokenBlocklist.id).filter_by(jti=jti).scalar()
-    return token is not None
+    return revoked_tokens.is_revoked(jwt_payload["jti"])
+
+def is_admin():
+    return current_user.username in app.config['ADMIN_USERNAMES']
 
 class Home (Resource):
     def get(self):
@@ -85,6 +111,10 @@ class LoginUser(Resource):
             return jsonify({"error": "email is incorrect."}), 400
 
         if new_user.authenticate(data['password']):
+            if needs_rehash(new_user._password_hash):
+                # The configured bcrypt cost changed since this hash was made.
+                new_user.password_hash = data['password']
+                db.session.commit()
             given_token = create_access_token(identity=new_user.username)
             return make_response(
                 jsonify(
@@ -103,13 +133,14 @@ class LoginUser(Resource):
 api.add_resource(LoginUser, "/login")
 
 class LogoutUser(Resource):
-    @jwt_required
+    @jwt_required()
     def delete(self):
         jti = get_jwt()["jti"]
         now = datetime.now(timezone.utc)
         token = TokenBlocklist(jti=jti, created_at=now)
         db.session.add(token)
         db.session.commit()
+        revoked_tokens.add(jti, now)
         return make_response(
             jsonify(
                 {"message": "Successfully logged out"}
@@ -155,23 +186,81 @@ api.add_resource(LogoutUser, "/logout")
 
 
 
+def product_to_dict(product):
+    return {
+        'id': product.id,
+        'name': product.name,
+        'price': product.price,
+        'description': product.description,
+        'quantity': product.quantity,
+        'image_url': product.image_url
+    }
+
+
 class Products(Resource):
     def get(self):
-        products = Product.query.all()
-        result = []
-        for product in products:
-            product_data = {
-                'id': product.id,
-                'name': product.name,
-                'price': product.price,
-                'description': product.description,
-                'quantity': product.quantity,
-                'image_url': product.image_url  # Include image_url here
-            }
-            result.append(product_data)
-
-        response = make_response(jsonify(result), 200)
-        return response
+        try:
+            columns = parse_fields(PRODUCT_COLUMNS, request.args.get('fields'))
+            catalog = CatalogQuery(request.args)
+        except (FieldError, CatalogError) as e:
+            return make_response(jsonify({"error": str(e)}), 400)
+
+        if request.args.get('stream'):
+            return self.stream(columns, catalog, request.args.get('limit', type=int))
+
+        tables = ('products', 'product_categories')
+        if catalog.uses_ratings:
+            tables += ('reviews',)
+        if catalog.uses_stock:
+            tables += ('stock',)
+        # Keyed on the table versions, taken before the page is read: a write
+        # moves every worker on to new keys, and a cached page is never older
+        # than the ETag it is served under. A sale only retires the cached
+        # pages that show the products it touched.
+        versions = current_versions()
+        key = (versions.of(*tables), page_params(request.args))
+        entry = catalog_cache.get(key)
+        if entry is None or entry[2] != versions.stock_of(*entry[1]):
+            # Keyset pagination: each page is an index range scan starting
+            # right after the (sort key, id) of the last row the client saw.
+            # Without parameters this is the first PRODUCT_PAGE_SIZE rows;
+            # clients that need the whole catalog use ?stream=1.
+            response = catalog.page(columns, page_size(request.args.get('limit', type=int)))
+            if catalog.facets:
+                response['facets'] = catalog.facet_counts()
+            product_ids = tuple(product['id'] for product in response['products'])
+            entry = (response, product_ids, versions.stock_of(*product_ids))
+            catalog_cache.set(key, entry)
+
+        response, _, stock = entry
+        etag = make_etag(key, stock)
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        if catalog.paged:
+            return tagged_response(response, etag)
+
+        # Unparameterised requests keep the original JSON array; the cursor
+        # for the next page travels in a header instead.
+        tagged = tagged_response(response['products'], etag)
+        if response['next_cursor'] is not None:
+            tagged.headers['X-Next-Cursor'] = str(response['next_cursor'])
+        return tagged
+
+    def stream(self, columns, catalog, limit):
+        query = catalog.select(columns).execution_options(yield_per=500)
+        if limit is not None:
+            query = query.limit(limit)
+
+        def generate():
+            yield '['
+            for index, row in enumerate(db.session.execute(query)):
+                if index:
+                    yield ','
+                yield app.json.dumps(catalog.to_dict(row))
+            yield ']'
+
+        return Response(stream_with_context(generate()), mimetype='application/json')
 
     def post(self):
         data = request.get_json()
@@ -188,6 +277,7 @@ class Products(Resource):
         )
 
         db.session.add(new_product)
+        bump_versions('products')
         db.session.commit()
 
         response = make_response(jsonify(message='Product created successfully'), 201)
@@ -200,28 +290,63 @@ api.add_resource(Products, '/products')
 
 class ProductById(Resource):
     def get(self, product_id):
+        try:
+            expand = parse_expand(request.args.get('expand'))
+        except CatalogError as e:
+            return make_response(jsonify({"error": str(e)}), 400)
+        if expand:
+            return self.expanded(product_id, expand)
+
+        versions = current_versions()
+        key = (product_id, versions.of('products'), versions.stock_of(product_id))
+        etag = make_etag(*key)
+        cached = not_modified(etag)
+        if cached:
+            return cached
+
+        response = product_cache.get(key)
+        if response is not None:
+            return tagged_response(response, etag)
+
         product = Product.query.filter_by(id=product_id).first()
         if product:
-            response = {
-                "id": product.id,
-                "name": product.name,
-                "price": product.price,
-                "description": product.description,
-                "quantity": product.quantity
-                }
-            return make_response(jsonify(response), 200)
+            response = detail_to_dict(product)
+            product_cache.set(key, response)
+            return tagged_response(response, etag)
         else:
             response = {"message": "Product not found"}
             return make_response(jsonify(response), 404)
 
+    def expanded(self, product_id, expand):
+        etag = table_etag(
+            ('products', 'product_categories', 'reviews'),
+            product_id, current_versions().stock_of(product_id), request.full_path
+        )
+        cached = not_modified(etag)
+        if cached:
+            return cached
+
+        reviews_limit = min(max(request.args.get('reviews_limit', app.config['REVIEWS_EXPAND_LIMIT'], type=int), 1), 100)
+        response = product_detail(product_id, expand, reviews_limit)
+        if response is None:
+            return make_response(jsonify({"message": "Product not found"}), 404)
+        return tagged_response(response, etag)
+
     def patch(self, product_id):
         product = Product.query.filter_by(id=product_id).first()
         if product:
             data = request.get_json()
+            if 'id' in data or 'version' in data:
+                return make_response(jsonify({"error": "id and version cannot be changed"}), 400)
             for key, value in data.items():
                 setattr(product, key, value)
-            db.session.commit()
-            return make_response(jsonify(product.to_dict()), 200)
+            bump_versions('products')
+            try:
+                db.session.commit()
+            except StaleDataError:
+                db.session.rollback()
+                return make_response(jsonify({"error": "Product was modified concurrently, please retry"}), 409)
+            return make_response(jsonify(product_to_dict(product)), 200)
         else:
             return make_response(jsonify({"error": "Product not found"}), 404)
 
@@ -229,6 +354,7 @@ class ProductById(Resource):
         product = Product.query.filter_by(id=product_id).first()
         if product:
             db.session.delete(product)
+            bump_versions('products')
             db.session.commit()
             return make_response(jsonify({"message": "Product deleted"}), 200)
         else:
@@ -237,58 +363,159 @@ class ProductById(Resource):
 api.add_resource(ProductById, "/products/<int:product_id>")
 
 
+class ProductReservations(Resource):
+    @jwt_required()
+    def post(self, product_id):
+        data = request.get_json() or {}
+        quantity = data.get('quantity', 1)
+        if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity < 1:
+            return make_response(jsonify({"error": "quantity must be a positive integer"}), 400)
+
+        try:
+            hold = reserve(product_id, quantity, user_id=current_user.id)
+        except ReservationError as e:
+            return make_response(jsonify({"error": str(e)}), e.status)
+
+        response = {
+            "id": hold.id,
+            "product_id": hold.product_id,
+            "quantity": hold.quantity,
+            "expires_at": hold.expires_at.isoformat()
+        }
+        return make_response(jsonify(response), 201)
+
+api.add_resource(ProductReservations, "/products/<int:product_id>/reservations")
+
+
+class ReservationById(Resource):
+    @jwt_required()
+    def delete(self, reservation_id):
+        if not release(reservation_id, user_id=current_user.id):
+            return make_response(jsonify({"error": "Reservation not found"}), 404)
+        return make_response(jsonify({"message": "Reservation released"}), 200)
+
+api.add_resource(ReservationById, "/reservations/<int:reservation_id>")
+
+
+class ProductSearch(Resource):
+    def get(self):
+        match = build_match(request.args.get('q'))
+        if not match:
+            return make_response(jsonify({"error": "A search query q is required"}), 400)
+
+        limit = min(max(request.args.get('limit', app.config['SEARCH_PAGE_SIZE'], type=int), 1), app.config['PRODUCT_PAGE_MAX'])
+        offset = max(request.args.get('offset', 0, type=int), 0)
+
+        etag = table_etag(('products', 'stock'), request.full_path)
+        cached = not_modified(etag)
+        if cached:
+            return cached
+
+        rows = search_products(match, limit + 1, offset)
+        response = {
+            "results": [product_to_dict(row) for row in rows[:limit]],
+            "next_offset": offset + limit if len(rows) > limit else None
+        }
+        return tagged_response(response, etag)
+
+api.add_resource(ProductSearch, "/products/search")
+
+
+class ProductsBulk(Resource):
+    def post(self):
+        try:
+            parsed = parse_rows(request.get_data(as_text=True), request.content_type)
+        except RowError as e:
+            return make_response(jsonify({"error": str(e)}), 400)
+        if not parsed:
+            return make_response(jsonify({"error": "No input data provided"}), 400)
+
+        upsert = request.args.get('mode', 'upsert') != 'insert'
+        result = import_products(parsed, upsert=upsert)
+        return make_response(jsonify(result), 200)
+
+    def patch(self):
+        try:
+            parsed = parse_rows(request.get_data(as_text=True), request.content_type)
+        except RowError as e:
+            return make_response(jsonify({"error": str(e)}), 400)
+        if not parsed:
+            return make_response(jsonify({"error": "No input data provided"}), 400)
+
+        result = update_products(parsed)
+        return make_response(jsonify(result), 200)
+
+api.add_resource(ProductsBulk, "/products/bulk")
+
+
+class CacheStats(Resource):
+    def get(self):
+        response = {
+            "products": product_cache.stats(),
+            "catalog": catalog_cache.stats()
+        }
+        return make_response(jsonify(response), 200)
+
+api.add_resource(CacheStats, "/cache/stats")
+
+
 class Orders(Resource):
     # @jwt_required()
     def get(self):
-        orders = Order.query.all()
-        order_list = [
-            {
-                "id": order.id,
-                "user_id": order.user_id,
-                "product_id": order.product_id,
-                "quantity": order.quantity,
-                "price": order.price,
-                "status": order.status
-            }
-            for order in orders
-        ]
+        try:
+            columns = parse_fields(ORDER_COLUMNS, request.args.get('fields'))
+        except FieldError as e:
+            return make_response(jsonify({"error": str(e)}), 400)
+
+        orders = db.session.execute(select(*columns).order_by(Order.id))
+        order_list = [row_to_dict(order) for order in orders]
         return make_response(jsonify(order_list), 200)
 
-    # @jwt_required()
+    @jwt_required()
+    @idempotent
     def post(self):
         data = request.get_json()
         if not data:
             response = {"message": "No input data provided"}
             return make_response(jsonify(response), 400)
 
-        user_id = get_jwt_identity()
+        try:
+            lines = parse_lines(data)
+            reservation_ids = parse_reservation_ids(data)
+            order_id = place_order(current_user.id, lines, status=data.get('status', 'pending'), reservation_ids=reservation_ids)
+        except OrderError as e:
+            return make_response(jsonify(e.to_dict()), e.status)
 
-        # Ensure both user_id and product_id are provided
-        if 'product_id' not in data:
-            response = {"message": "product_id is required"}
-            return make_response(jsonify(response), 400)
+        response = {"message": "Order created successfully", "order_id": order_id}
+        return make_response(jsonify(response), 201)
 
-        # Check if the product exists
-        product = Product.query.get(data['product_id'])
-        if not product:
-            response = {"message": "Product does not exist"}
-            return make_response(jsonify(response), 404)
+api.add_resource(Orders, '/orders')
 
-        new_order = Order(
-            user_id=user_id,  # Assigning user_id from JWT token
-            product_id=data['product_id'],  # Assigning product_id from request data
-            quantity=data.get('quantity'),
-            price=data.get('price'),
-            status=data.get('status', 'pending')
-        )
 
-        db.session.add(new_order)
-        db.session.commit()
+class UserOrders(Resource):
+    @jwt_required()
+    def get(self, user_id=None):
+        if user_id is None:
+            user_id = current_user.id
+        elif user_id != current_user.id and not is_admin():
+            return make_response(jsonify({"error": "Not allowed to view these orders"}), 403)
 
-        response = {"message": "Order created successfully"}
-        return make_response(jsonify(response), 201)
+        try:
+            columns = parse_fields(ORDER_COLUMNS, request.args.get('fields'))
+        except FieldError as e:
+            return make_response(jsonify({"error": str(e)}), 400)
+
+        page = order_history(
+            user_id,
+            columns,
+            after=request.args.get('after', type=int),
+            limit=request.args.get('limit', type=int),
+            status=request.args.get('status')
+        )
+        page['orders'] = [row_to_dict(order) for order in page['orders']]
+        return make_response(jsonify(page), 200)
 
-api.add_resource(Orders, '/orders')
+api.add_resource(UserOrders, '/me/orders', '/users/<int:user_id>/orders')
 
 
 class OrderById(Resource):
@@ -318,12 +545,16 @@ class OrderById(Resource):
         if not data:
             return make_response(jsonify({"error": "No input data provided"}), 400)
         
+        unrecord_order(order.id)
         if 'quantity' in data:
             order.quantity = data['quantity']
         if 'price' in data:
             order.price = data['price']
-        if 'status' in data:
+        if 'status' in data and data['status'] != order.status:
+            emit('order.status_changed', order.user_id, order_id=order.id, old_status=order.status, new_status=data['status'])
             order.status = data['status']
+        db.session.flush()
+        record_order(order.id)
         
         db.session.commit()
         
@@ -335,6 +566,7 @@ class OrderById(Resource):
         if not order:
             return make_response(jsonify({"error": "Order not found"}), 404)
         
+        unrecord_order(order.id)
         db.session.delete(order)
         db.session.commit()
         
@@ -361,6 +593,7 @@ class OrderItems(Resource):
         return make_response(jsonify(order_item_list), 200)
 
     # @jwt_required()
+    @idempotent
     def post(self):
         data = request.get_json()
         if not data:
@@ -375,7 +608,12 @@ class OrderItems(Resource):
             status=data.get('status', 'pending')
         )
 
+        if new_order_item.order_id is not None:
+            unrecord_order(new_order_item.order_id)
         db.session.add(new_order_item)
+        db.session.flush()
+        if new_order_item.order_id is not None:
+            record_order(new_order_item.order_id)
         db.session.commit()
 
         response = {"message": "Order item created successfully"}
@@ -384,6 +622,20 @@ class OrderItems(Resource):
 api.add_resource(OrderItems , "/order-items")
 
 
+class SalesReport(Resource):
+    @jwt_required()
+    def get(self):
+        if not is_admin():
+            return make_response(jsonify({"error": "Not allowed to view reports"}), 403)
+        try:
+            report = sales_report(request.args)
+        except ReportError as e:
+            return make_response(jsonify({"error": str(e)}), 400)
+        return make_response(jsonify(report), 200)
+
+api.add_resource(SalesReport, '/reports/sales')
+
+
 # class ShoppingCart(Resource):
 #     # @jwt_required()
 #     def get(self):
@@ -490,27 +742,16 @@ class ShoppingCart(Resource):
         current_user_id = 1  # Placeholder for the current user ID
         print(f'current_user_id (GET): {current_user_id}')
 
-        user_cart = CartItem.query.filter_by(cart_id=current_user_id).all()
+        user_cart = cart_store.view(current_user_id)
 
         if user_cart:
-            serialized_cart_items = []
-            for cart_item in user_cart:
-                product = Product.query.get(cart_item.product_id)
-                serialized_cart_items.append({
-                    'id': cart_item.id,
-                    'product_id': cart_item.product_id,
-                    'quantity': cart_item.quantity,
-                    'name': product.name,
-                    'price': product.price,
-                    'image_url': product.image_url
-                })
-
-            response = jsonify(serialized_cart_items)
+            response = jsonify(user_cart)
             response.status_code = 200
             return response
         else:
             return {'message': 'Cart not found'}, 404
 
+    @idempotent
     def post(self):
         current_user_id = 1  # Placeholder for the current user ID
         print(f'current_user_id (POST): {current_user_id}')
@@ -521,21 +762,18 @@ class ShoppingCart(Resource):
             quantity = data.get('quantity', 1)  # Default quantity to 1
 
             if product_id:
-                if not Product.query.filter_by(id=product_id).first():
+                # A primary-key probe; loading the whole Product here would
+                # cost more than the store's add itself.
+                if db.session.execute(select(Product.id).where(Product.id == product_id)).first() is None:
                     raise ValueError('Product with provided ID not found')
             else:
                 raise ValueError('A product_id must be provided')
+            if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity < 1:
+                raise ValueError('quantity must be a positive integer')
 
-            new_cart_item = CartItem(
-                cart_id=current_user_id,
-                product_id=product_id,
-                quantity=quantity
-            )
-
-            db.session.add(new_cart_item)
-            db.session.commit()
+            item_id, quantity = cart_store.add(current_user_id, product_id, quantity)
 
-            return {'message': 'Cart item added successfully'}, 201
+            return {'message': 'Cart item added successfully', 'id': item_id, 'quantity': quantity}, 201
 
         except Exception as e:
             db.session.rollback()
@@ -548,11 +786,10 @@ class ShoppingCart(Resource):
 
         try:
             updated_quantity = data.get('quantity')
-            cart_item = CartItem.query.filter_by(id=item_id, cart_id=current_user_id).first()
+            if not isinstance(updated_quantity, int) or isinstance(updated_quantity, bool) or updated_quantity < 1:
+                raise ValueError('quantity must be a positive integer')
 
-            if cart_item:
-                cart_item.quantity = updated_quantity
-                db.session.commit()
+            if cart_store.set_quantity(current_user_id, item_id, updated_quantity):
                 return {'message': 'Cart item updated successfully'}, 200
             else:
                 return {'error': 'Cart item not found'}, 404
@@ -566,11 +803,7 @@ class ShoppingCart(Resource):
         print(f'current_user_id (DELETE): {current_user_id}')
 
         try:
-            cart_item = CartItem.query.filter_by(id=item_id, cart_id=current_user_id).first()
-
-            if cart_item:
-                db.session.delete(cart_item)
-                db.session.commit()
+            if cart_store.remove(current_user_id, item_id):
                 return {'message': 'Cart item deleted successfully'}, 200
             else:
                 return {'error': 'Cart item not found'}, 404
@@ -579,12 +812,44 @@ class ShoppingCart(Resource):
             db.session.rollback()
             return {'error': str(e)}, 400
 
-api.add_resource(ShoppingCart, '/userCart', '/userCart/<int:item_id>')
+api.add_resource(ShoppingCart, '/userCart', '/userCart/<int(signed=True):item_id>')
+
+
+class CartCheckout(Resource):
+    @jwt_required()
+    @idempotent
+    def post(self):
+        cart_id = 1  # Placeholder until carts belong to users
+        data = request.get_json(silent=True) or {}
+        try:
+            reservation_ids = parse_reservation_ids(data)
+        except OrderError as e:
+            return make_response(jsonify(e.to_dict()), e.status)
+
+        # Pending edits must be in cart_items before checkout reads it; the
+        # store's copy is dropped so the next edit starts from the empty cart.
+        cart_store.flush_and_discard(cart_id)
+        try:
+            order_id, line_count = checkout_cart(
+                cart_id, current_user.id, status=data.get('status', 'pending'), reservation_ids=reservation_ids
+            )
+        except OrderError as e:
+            return make_response(jsonify(e.to_dict()), e.status)
+
+        response = {"message": "Order created successfully", "order_id": order_id, "items": line_count}
+        return make_response(jsonify(response), 201)
+
+api.add_resource(CartCheckout, '/userCart/checkout')
 
 
 class ProductCategories(Resource):
     @jwt_required()
     def get(self):
+        etag = table_etag(('product_categories',))
+        cached = not_modified(etag)
+        if cached:
+            return cached
+
         categories = ProductCategory.query.all()
         category_list = [
             {
@@ -594,7 +859,7 @@ class ProductCategories(Resource):
             }
             for category in categories
         ]
-        return make_response(jsonify(category_list), 200)
+        return tagged_response(category_list, etag)
 
     @jwt_required()
     def post(self):
@@ -609,6 +874,7 @@ class ProductCategories(Resource):
         )
 
         db.session.add(new_category)
+        bump_versions('product_categories')
         db.session.commit()
 
         response = {"message": "Product category created successfully"}
@@ -621,19 +887,13 @@ api.add_resource(ProductCategories , "/product-categories")
 class Reviews(Resource):
     @jwt_required()
     def get(self):
-        reviews = Review.query.all()
-        review_list = [
-            {
-                "id": review.id,
-                "user_id": review.user_id,
-                "product_id": review.product_id,
-                "rating": review.rating,
-                "review": review.review,
-                "date": review.date.isoformat(),
-                "status": review.status
-            }
-            for review in reviews
-        ]
+        try:
+            columns = parse_fields(REVIEW_COLUMNS, request.args.get('fields'))
+        except FieldError as e:
+            return make_response(jsonify({"error": str(e)}), 400)
+
+        reviews = db.session.execute(select(*columns).order_by(Review.id))
+        review_list = [row_to_dict(review) for review in reviews]
         return make_response(jsonify(review_list), 200)
 
     @jwt_required()
@@ -643,17 +903,23 @@ class Reviews(Resource):
             response = {"message": "No input data provided"}
             return make_response(jsonify(response), 400)
 
-        user_id = get_jwt_identity()  # Retrieving user ID from JWT token
+        if not is_valid_rating(data.get('rating')):
+            response = {"message": "rating must be an integer from 1 to 5"}
+            return make_response(jsonify(response), 400)
 
         new_review = Review(
-            user_id=user_id,
+            user_id=current_user.id,
             product_id=data.get('product_id'),
             rating=data.get('rating'),
             review=data.get('review'),
-            status=data.get('status', 'pending')
+            # Only admins moderate; everyone else's reviews start pending.
+            status=data.get('status', 'pending') if is_admin() else 'pending'
         )
 
         db.session.add(new_review)
+        if counts_toward_rating(new_review):
+            apply_rating(new_review.product_id, new_review.rating)
+        bump_versions('reviews')
         db.session.commit()
 
         response = {"message": "Review created successfully"}
@@ -662,26 +928,56 @@ class Reviews(Resource):
 api.add_resource(Reviews, "/reviews")
 
 
+class ReviewById(Resource):
+    @jwt_required()
+    def patch(self, review_id):
+        review = Review.query.get(review_id)
+        if not review:
+            return make_response(jsonify({"error": "Review not found"}), 404)
+
+        data = request.get_json()
+        if not data:
+            return make_response(jsonify({"error": "No input data provided"}), 400)
+        if ('rating' in data or 'review' in data) and review.user_id != current_user.id:
+            return make_response(jsonify({"error": "Only the author can edit this review"}), 403)
+        if 'status' in data and not is_admin():
+            return make_response(jsonify({"error": "Only admins can change a review's status"}), 403)
+        if 'rating' in data and not is_valid_rating(data['rating']):
+            return make_response(jsonify({"error": "rating must be an integer from 1 to 5"}), 400)
+
+        # Take the review out of its product's stats and add it back as it is
+        # after the change, all in the same transaction as the update.
+        if counts_toward_rating(review):
+            apply_rating(review.product_id, review.rating, -1)
+        if 'rating' in data:
+            review.rating = data['rating']
+        if 'review' in data:
+            review.review = data['review']
+        if 'status' in data and data['status'] != review.status:
+            emit('review.status_changed', review.user_id, review_id=review.id, old_status=review.status, new_status=data['status'])
+            review.status = data['status']
+        if counts_toward_rating(review):
+            apply_rating(review.product_id, review.rating)
+
+        bump_versions('reviews')
+        db.session.commit()
+
+        return make_response(jsonify({"message": "Review updated successfully"}), 200)
+
+api.add_resource(ReviewById, "/reviews/<int:review_id>")
+
+
 
 class Addresses(Resource):
     # @jwt_required()
     def get(self):
-        addresses = Address.query.all()
-        address_list = [
-            {
-                "id": address.id,
-                "user_id": address.user_id,
-                "address": address.address,
-                "city": address.city,
-                "state": address.state,
-                "zip_code": address.zip_code,
-                "country": address.country,
-                "phone": address.phone,
-                "date": address.date.isoformat(),
-                "status": address.status
-            }
-            for address in addresses
-        ]
+        try:
+            columns = parse_fields(ADDRESS_COLUMNS, request.args.get('fields'))
+        except FieldError as e:
+            return make_response(jsonify({"error": str(e)}), 400)
+
+        addresses = db.session.execute(select(*columns).order_by(Address.id))
+        address_list = [row_to_dict(address) for address in addresses]
         return make_response(jsonify(address_list), 200)
 
     # @jwt_required()
@@ -740,7 +1036,7 @@ class Notifications(Resource):
             response = {"message": "No input data provided"}
             return make_response(jsonify(response), 400)
 
-        user_id = get_jwt_identity()  # Retrieving user ID from JWT token
+        user_id = current_user.id
 
         new_notification = Notification(
             user_id=user_id,
@@ -753,6 +1049,7 @@ class Notifications(Resource):
 
         db.session.add(new_notification)
         db.session.commit()
+        notification_hub.publish(user_id)
 
         response = {"message": "Notification created successfully"}
         return make_response(jsonify(response), 201)
@@ -760,5 +1057,72 @@ class Notifications(Resource):
 api.add_resource(Notifications, "/notification")
 
 
+class NotificationStream(Resource):
+    # EventSource cannot set an Authorization header, so the token may also
+    # come from the access cookie or a ?jwt= query parameter.
+    @jwt_required(locations=['headers', 'cookies', 'query_string'])
+    def get(self):
+        last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+        if last_event_id is not None:
+            try:
+                last_event_id = int(last_event_id)
+            except ValueError:
+                return make_response(jsonify({"error": "Last-Event-ID must be a notification id"}), 400)
+
+        try:
+            events = notification_events(current_user.id, last_event_id)
+        except StreamLimitReached:
+            response = make_response(jsonify({"error": "Too many open streams, please try again shortly."}), 503)
+            response.headers['Retry-After'] = str(app.config['STREAM_RETRY_MS'] // 1000)
+            return response
+
+        response = Response(stream_with_context(events), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+
+api.add_resource(NotificationStream, "/notifications/stream")
+
+
+class Inbox(Resource):
+    @jwt_required()
+    def get(self):
+        try:
+            page = inbox_page(
+                current_user.id,
+                after=request.args.get('after'),
+                limit=request.args.get('limit', type=int),
+                unread_only=request.args.get('unread', '').lower() in ('1', 'true', 'yes')
+            )
+        except InboxError as e:
+            return make_response(jsonify({"error": str(e)}), 400)
+        return make_response(jsonify(page), 200)
+
+api.add_resource(Inbox, "/me/notifications")
+
+
+class InboxUnreadCount(Resource):
+    @jwt_required()
+    def get(self):
+        return make_response(jsonify({"unread": unread_count(current_user.id)}), 200)
+
+api.add_resource(InboxUnreadCount, "/me/notifications/unread-count")
+
+
+class InboxRead(Resource):
+    @jwt_required()
+    def post(self):
+        data = request.get_json(silent=True) or {}
+        bounds = {name: data.get(name) for name in ('from_id', 'to_id')}
+        for name, value in bounds.items():
+            if value is not None and (not isinstance(value, int) or isinstance(value, bool)):
+                return make_response(jsonify({"error": f"{name} must be an integer"}), 400)
+
+        updated = mark_read(current_user.id, **bounds)
+        return make_response(jsonify({"updated": updated, "unread": unread_count(current_user.id)}), 200)
+
+api.add_resource(InboxRead, "/me/notifications/read")
+
+
 if __name__ == '__main__':
     app.run(port=5555, debug=True)
\ No newline at end of file
@@ -0,0 +1,187 @@
+import json
+
+from sqlalchemy import bindparam, func, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from config import app, db, select
+from models import Product
+from versions import bump_versions
+
+products = Product.__table__
+
+PRODUCT_FIELDS = ('name', 'price', 'description', 'quantity', 'image_url')
+UPDATE_FIELDS = ('price', 'quantity')
+
+
+class RowError(ValueError):
+    pass
+
+
+def parse_rows(body, content_type):
+    """Return ``(index, row_or_error)`` pairs from a JSON array or NDJSON body."""
+    if 'ndjson' not in (content_type or '') and body.lstrip().startswith('['):
+        try:
+            rows = json.loads(body)
+        except ValueError as e:
+            raise RowError(f'Invalid JSON: {e}')
+        if not isinstance(rows, list):
+            raise RowError('Expected a JSON array of products')
+        return list(enumerate(rows))
+
+    parsed = []
+    for index, line in enumerate(line for line in body.splitlines() if line.strip()):
+        try:
+            parsed.append((index, json.loads(line)))
+        except ValueError as e:
+            parsed.append((index, RowError(f'Invalid JSON: {e}')))
+    return parsed
+
+
+def _check_number(row, field):
+    value = row.get(field)
+    if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+        raise RowError(f'{field} must be a number')
+    if value is not None and value < 0:
+        raise RowError(f'{field} cannot be negative')
+
+
+def clean_product(row):
+    if isinstance(row, Exception):
+        raise row
+    if not isinstance(row, dict):
+        raise RowError('Each product must be an object')
+    if not isinstance(row.get('name'), str) or not row['name'].strip():
+        raise RowError('name is required')
+    unknown = set(row) - set(PRODUCT_FIELDS)
+    if unknown:
+        raise RowError(f'Unknown fields: {", ".join(sorted(unknown))}')
+    for field in UPDATE_FIELDS:
+        _check_number(row, field)
+    return {field: row.get(field) for field in PRODUCT_FIELDS}
+
+
+def clean_update(row):
+    if isinstance(row, Exception):
+        raise row
+    if not isinstance(row, dict):
+        raise RowError('Each update must be an object')
+    if row.get('id') is None and row.get('name') is None:
+        raise RowError('id or name is required')
+    if row.get('id') is not None and (isinstance(row['id'], bool) or not isinstance(row['id'], int)):
+        raise RowError('id must be an integer')
+    if row.get('name') is not None and not isinstance(row['name'], str):
+        raise RowError('name must be a string')
+    if not any(field in row for field in UPDATE_FIELDS):
+        raise RowError('price or quantity is required')
+    for field in UPDATE_FIELDS:
+        _check_number(row, field)
+    return {
+        'b_id': row.get('id'),
+        'b_name': row.get('name'),
+        'b_price': row.get('price'),
+        'b_quantity': row.get('quantity')
+    }
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _run_chunk(statement, chunk, errors):
+    """Execute ``chunk`` with one executemany call, falling back row by row on failure."""
+    try:
+        with db.session.begin_nested():
+            db.session.execute(statement, [params for _, params in chunk])
+        return len(chunk)
+    except SQLAlchemyError:
+        pass
+
+    succeeded = 0
+    for index, params in chunk:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(statement, params)
+            succeeded += 1
+        except SQLAlchemyError as e:
+            errors.append({"index": index, "error": str(e.orig if hasattr(e, 'orig') else e)})
+    return succeeded
+
+
+def import_products(parsed, upsert=True):
+    statement = insert(products)
+    if upsert:
+        # Omitted fields keep their stored value instead of being nulled out.
+        statement = statement.on_conflict_do_update(
+            index_elements=[products.c.name],
+            set_={
+                **{
+                    field: func.coalesce(statement.excluded[field], products.c[field])
+                    for field in PRODUCT_FIELDS if field != 'name'
+                },
+                'version': products.c.version + 1
+            }
+        )
+
+    errors, valid = [], []
+    for index, row in parsed:
+        try:
+            valid.append((index, clean_product(row)))
+        except RowError as e:
+            errors.append({"index": index, "error": str(e)})
+
+    succeeded = 0
+    for chunk in _chunks(valid, app.config['BULK_CHUNK_SIZE']):
+        succeeded += _run_chunk(statement, chunk, errors)
+        bump_versions('products')
+        db.session.commit()
+
+    errors.sort(key=lambda error: error['index'])
+    return {"processed": len(parsed), "succeeded": succeeded, "errors": errors}
+
+
+def update_products(parsed):
+    values = {
+        'price': func.coalesce(bindparam('b_price'), products.c.price),
+        'quantity': func.coalesce(bindparam('b_quantity'), products.c.quantity),
+        'version': products.c.version + 1
+    }
+    by_id = update(products).where(products.c.id == bindparam('b_id')).values(**values)
+    by_name = update(products).where(products.c.name == bindparam('b_name')).values(**values)
+
+    errors, valid = [], []
+    for index, row in parsed:
+        try:
+            valid.append((index, clean_update(row)))
+        except RowError as e:
+            errors.append({"index": index, "error": str(e)})
+
+    succeeded = 0
+    for chunk in _chunks(valid, app.config['BULK_CHUNK_SIZE']):
+        ids = {params['b_id'] for _, params in chunk if params['b_id'] is not None}
+        names = {params['b_name'] for _, params in chunk if params['b_id'] is None}
+        existing = db.session.execute(
+            select(products.c.id, products.c.name).where(products.c.id.in_(ids) | products.c.name.in_(names))
+        ).all()
+        existing_ids = {row.id for row in existing}
+        id_by_name = {row.name: row.id for row in existing}
+
+        keyed_by_id, keyed_by_name = [], []
+        for index, params in chunk:
+            if params['b_id'] is not None and params['b_id'] in existing_ids:
+                keyed_by_id.append((index, params))
+            elif params['b_id'] is None and params['b_name'] in id_by_name:
+                keyed_by_name.append((index, params))
+            else:
+                errors.append({"index": index, "error": "Product not found"})
+
+        if keyed_by_id:
+            succeeded += _run_chunk(by_id, keyed_by_id, errors)
+        if keyed_by_name:
+            succeeded += _run_chunk(by_name, keyed_by_name, errors)
+        bump_versions('products')
+        db.session.commit()
+
+    errors.sort(key=lambda error: error['index'])
+    return {"processed": len(parsed), "succeeded": succeeded, "errors": errors}
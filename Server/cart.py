@@ -0,0 +1,161 @@
+import statistics
+import time
+
+import click
+from sqlalchemy import Integer, delete, func
+from sqlalchemy.dialects.sqlite import insert
+
+from config import app, db, select
+from models import CartItem, Order, OrderItem, OutboxEvent, Product, SalesDailyProduct
+from orders import OrderError, create_order
+
+cart_items = CartItem.__table__
+
+
+def cart_view(cart_id):
+    """Items of a cart with their products, per-line stock flags and the cart
+    totals, all from one joined statement. Totals are window aggregates so
+    they ride along on every row instead of needing a second query."""
+    line_total = CartItem.quantity * func.coalesce(Product.price, 0)
+    out_of_stock = func.coalesce(Product.quantity, 0) < CartItem.quantity
+    rows = db.session.execute(
+        select(
+            CartItem.id,
+            CartItem.product_id,
+            CartItem.quantity,
+            Product.name,
+            Product.price,
+            Product.image_url,
+            line_total.label('line_total'),
+            out_of_stock.label('out_of_stock'),
+            func.sum(line_total).over().label('subtotal'),
+            func.sum(CartItem.quantity).over().label('item_count'),
+            func.sum(out_of_stock, type_=Integer).over().label('out_of_stock_count'),
+        )
+        .outerjoin(Product, Product.id == CartItem.product_id)
+        .where(CartItem.cart_id == cart_id)
+        .order_by(CartItem.id)
+    ).all()
+    if not rows:
+        return None
+
+    return {
+        "items": [
+            {
+                "id": row.id,
+                "product_id": row.product_id,
+                "quantity": row.quantity,
+                "name": row.name,
+                "price": row.price,
+                "image_url": row.image_url,
+                "line_total": row.line_total,
+                "out_of_stock": bool(row.out_of_stock),
+            }
+            for row in rows
+        ],
+        "subtotal": rows[0].subtotal,
+        "item_count": rows[0].item_count,
+        "out_of_stock_count": rows[0].out_of_stock_count,
+    }
+
+
+def add_to_cart(cart_id, product_id, quantity):
+    """Add ``quantity`` of a product to a cart in one atomic statement, topping
+    up the existing line if the product is already there. Returns the line."""
+    statement = insert(cart_items).values(cart_id=cart_id, product_id=product_id, quantity=quantity)
+    statement = statement.on_conflict_do_update(
+        index_elements=[cart_items.c.cart_id, cart_items.c.product_id],
+        set_={'quantity': cart_items.c.quantity + statement.excluded.quantity}
+    )
+    return db.session.execute(
+        statement.returning(cart_items.c.id, cart_items.c.quantity)
+    ).one()
+
+
+def checkout_cart(cart_id, user_id, status='pending', reservation_ids=None):
+    """Turn a cart into an order in one transaction.
+
+    Emptying the cart with DELETE ... RETURNING is the first statement, so it
+    takes SQLite's write lock and reads the lines in the same step; a second
+    checkout of the same cart waits and then finds it empty. Stock is then
+    checked and decremented by create_order, and any failure rolls the whole
+    thing back, cart included. Held ``reservation_ids`` are consumed as in
+    create_order. Returns ``(order_id, line_count)``.
+    """
+    rows = db.session.execute(
+        delete(cart_items)
+        .where(cart_items.c.cart_id == cart_id)
+        .returning(cart_items.c.product_id, cart_items.c.quantity)
+    ).all()
+
+    lines = {}
+    for row in rows:
+        if row.product_id is not None:
+            lines[row.product_id] = lines.get(row.product_id, 0) + row.quantity
+    if not lines:
+        db.session.rollback()
+        raise OrderError("Cart not found", 404)
+
+    order_id = create_order(user_id, lines, status, reservation_ids)
+    db.session.commit()
+    return order_id, len(lines)
+
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+@app.cli.command('bench-checkout')
+@click.option('--sizes', default='1,20,200', help='Comma-separated cart sizes to time.')
+@click.option('--runs', default=50, help='Checkouts per cart size.')
+def bench_checkout_command(sizes, runs):
+    """Time cart checkout for several cart sizes and report p50/p99.
+
+    Runs against the configured database with throwaway products and a
+    throwaway cart that are removed again afterwards, so point it at a
+    development database.
+    """
+    sizes = [int(size) for size in sizes.split(',')]
+    prefix = f'bench-{time.time_ns()}'
+    db.session.execute(
+        insert(Product.__table__),
+        [{"name": f'{prefix}-{n}', "price": 1, "quantity": runs * 10} for n in range(max(sizes))]
+    )
+    db.session.commit()
+    product_ids = db.session.execute(
+        select(Product.id).where(Product.name.like(f'{prefix}-%')).order_by(Product.id)
+    ).scalars().all()
+    cart_id = -time.time_ns() % 1_000_000_000 - 1_000_000_000
+
+    order_ids = []
+    try:
+        for size in sizes:
+            timings = []
+            for _ in range(runs):
+                db.session.execute(
+                    insert(cart_items),
+                    [{"cart_id": cart_id, "product_id": product_id, "quantity": 1} for product_id in product_ids[:size]]
+                )
+                db.session.commit()
+
+                started = time.perf_counter()
+                order_id, _ = checkout_cart(cart_id, None)
+                timings.append((time.perf_counter() - started) * 1000)
+                order_ids.append(order_id)
+
+            print(
+                f'{size:>4} item(s): p50 {statistics.median(timings):.2f} ms, '
+                f'p99 {_percentile(timings, 0.99):.2f} ms over {runs} checkouts'
+            )
+    finally:
+        db.session.rollback()
+        db.session.execute(delete(cart_items).where(cart_items.c.cart_id == cart_id))
+        db.session.execute(delete(OrderItem.__table__).where(OrderItem.product_id.in_(product_ids)))
+        db.session.execute(delete(Order.__table__).where(Order.id.in_(order_ids)))
+        db.session.execute(delete(OutboxEvent.__table__).where(
+            OutboxEvent.topic == 'order.placed', OutboxEvent.user_id.is_(None)
+        ))
+        db.session.execute(delete(SalesDailyProduct.__table__).where(SalesDailyProduct.product_id.in_(product_ids)))
+        db.session.execute(delete(Product.__table__).where(Product.id.in_(product_ids)))
+        db.session.commit()
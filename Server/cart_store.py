@@ -0,0 +1,295 @@
+import atexit
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from sqlalchemy import bindparam, delete, update
+from sqlalchemy.dialects.sqlite import insert
+
+from config import app, db, select
+from models import CartItem, Product
+from cart import cart_items, cart_view, add_to_cart
+from scheduler import schedule
+
+
+class CartStore(ABC):
+    """Where cart lines live between edits.
+
+    Line ids are the ``cart_items`` ids where a line has been written to the
+    database; stores that hold lines back may hand out negative ids meanwhile,
+    and must keep accepting them.
+    """
+
+    @abstractmethod
+    def view(self, cart_id):
+        """The cart as returned by GET /userCart, or None when it is empty."""
+
+    @abstractmethod
+    def add(self, cart_id, product_id, quantity):
+        """Add to a line, creating it if needed; returns ``(line_id, quantity)``."""
+
+    @abstractmethod
+    def set_quantity(self, cart_id, line_id, quantity):
+        """Returns False when the cart has no such line."""
+
+    @abstractmethod
+    def remove(self, cart_id, line_id):
+        """Returns False when the cart has no such line."""
+
+    def flush(self, cart_ids=None):
+        """Write pending changes for ``cart_ids`` (default: all) to the database
+        and return how many carts were written."""
+        return 0
+
+    def discard(self, cart_id):
+        """Forget any state held for a cart, e.g. once it has been checked out."""
+
+    def flush_and_discard(self, cart_id):
+        """Write a cart's pending changes and forget it, with no edit able to
+        land in between; used right before checkout reads ``cart_items``."""
+        self.flush([cart_id])
+        self.discard(cart_id)
+
+
+class SQLCartStore(CartStore):
+    """Every edit is its own committed statement against ``cart_items``."""
+
+    def view(self, cart_id):
+        return cart_view(cart_id)
+
+    def add(self, cart_id, product_id, quantity):
+        line = add_to_cart(cart_id, product_id, quantity)
+        db.session.commit()
+        return line.id, line.quantity
+
+    def set_quantity(self, cart_id, line_id, quantity):
+        result = db.session.execute(
+            update(cart_items)
+            .where(cart_items.c.id == line_id, cart_items.c.cart_id == cart_id)
+            .values(quantity=quantity)
+        )
+        db.session.commit()
+        return result.rowcount > 0
+
+    def remove(self, cart_id, line_id):
+        result = db.session.execute(
+            delete(cart_items).where(cart_items.c.id == line_id, cart_items.c.cart_id == cart_id)
+        )
+        db.session.commit()
+        return result.rowcount > 0
+
+
+class _CachedCart:
+    __slots__ = ('lines', 'ids', 'touched')
+
+    def __init__(self, rows):
+        # product_id -> quantity; 0 marks a line removed but not yet deleted.
+        self.lines = {row.product_id: row.quantity for row in rows}
+        self.ids = {row.product_id: row.id for row in rows}
+        self.touched = time.monotonic()
+
+    def product_for(self, line_id):
+        if line_id < 0:
+            product_id = -line_id
+        else:
+            product_id = next((product for product, id_ in self.ids.items() if id_ == line_id), None)
+        return product_id if self.lines.get(product_id) else None
+
+
+class MemoryCartStore(CartStore):
+    """Write-behind store: carts are edited in memory and written out in
+    batches by ``flush``. Lines not yet written use ``-product_id`` as their id.
+
+    State is per process, so this only suits a single worker; a shared
+    key-value store can implement CartStore for multi-worker deployments.
+    Edits made since the last flush are lost if the process dies.
+    """
+
+    def __init__(self, idle_ttl):
+        self.idle_ttl = idle_ttl
+        self._carts = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+    def _cart(self, cart_id):
+        cart = self._carts.get(cart_id)
+        if cart is None:
+            # Loaded under the lock so two first edits cannot each load the
+            # cart and drop the other's change; it is one indexed lookup.
+            rows = db.session.execute(
+                select(CartItem.id, CartItem.product_id, CartItem.quantity)
+                .where(CartItem.cart_id == cart_id, CartItem.product_id.isnot(None))
+            ).all()
+            cart = self._carts[cart_id] = _CachedCart(rows)
+        cart.touched = time.monotonic()
+        return cart
+
+    def view(self, cart_id):
+        with self._lock:
+            cart = self._cart(cart_id)
+            lines = {product_id: quantity for product_id, quantity in cart.lines.items() if quantity}
+            ids = {product_id: cart.ids.get(product_id, -product_id) for product_id in lines}
+        if not lines:
+            return None
+
+        products = {
+            row.id: row for row in db.session.execute(
+                select(Product.id, Product.name, Product.price, Product.image_url, Product.quantity)
+                .where(Product.id.in_(lines))
+            )
+        }
+        items = []
+        for product_id, quantity in sorted(lines.items(), key=lambda line: (ids[line[0]] < 0, abs(ids[line[0]]))):
+            product = products.get(product_id)
+            price = product.price if product else None
+            items.append({
+                "id": ids[product_id],
+                "product_id": product_id,
+                "quantity": quantity,
+                "name": product.name if product else None,
+                "price": price,
+                "image_url": product.image_url if product else None,
+                "line_total": quantity * (price or 0),
+                "out_of_stock": (product.quantity or 0) < quantity if product else True,
+            })
+        return {
+            "items": items,
+            "subtotal": sum(item['line_total'] for item in items),
+            "item_count": sum(item['quantity'] for item in items),
+            "out_of_stock_count": sum(item['out_of_stock'] for item in items),
+        }
+
+    def add(self, cart_id, product_id, quantity):
+        with self._lock:
+            cart = self._cart(cart_id)
+            cart.lines[product_id] = cart.lines.get(product_id, 0) + quantity
+            self._dirty.add(cart_id)
+            return cart.ids.get(product_id, -product_id), cart.lines[product_id]
+
+    def set_quantity(self, cart_id, line_id, quantity):
+        with self._lock:
+            cart = self._cart(cart_id)
+            product_id = cart.product_for(line_id)
+            if product_id is None:
+                return False
+            cart.lines[product_id] = quantity
+            self._dirty.add(cart_id)
+            return True
+
+    def remove(self, cart_id, line_id):
+        with self._lock:
+            cart = self._cart(cart_id)
+            product_id = cart.product_for(line_id)
+            if product_id is None:
+                return False
+            cart.lines[product_id] = 0
+            self._dirty.add(cart_id)
+            return True
+
+    def flush(self, cart_ids=None):
+        # Writes happen under the lock, so no edit can slip in between the
+        # snapshot and the write, and no flush can land after a later
+        # flush_and_discard of the same cart. Edits wait for one batch write.
+        with self._lock:
+            targets = [cart_id for cart_id in (self._dirty if cart_ids is None else cart_ids) if cart_id in self._dirty]
+            if targets:
+                snapshot = {cart_id: dict(self._carts[cart_id].lines) for cart_id in targets}
+                try:
+                    self._write(snapshot)
+                    written = db.session.execute(
+                        select(CartItem.id, CartItem.cart_id, CartItem.product_id).where(CartItem.cart_id.in_(targets))
+                    ).all()
+                except Exception:
+                    db.session.rollback()
+                    raise
+                self._dirty.difference_update(targets)
+
+                for cart_id in targets:
+                    cart = self._carts[cart_id]
+                    cart.lines = {product_id: quantity for product_id, quantity in cart.lines.items() if quantity}
+                    cart.ids = {}
+                for row in written:
+                    self._carts[row.cart_id].ids[row.product_id] = row.id
+
+        self._evict_idle()
+        return len(targets)
+
+    def discard(self, cart_id):
+        with self._lock:
+            self._carts.pop(cart_id, None)
+            self._dirty.discard(cart_id)
+
+    def flush_and_discard(self, cart_id):
+        # The write happens under the lock: an add arriving meanwhile waits,
+        # then loads the cart from the rows written here.
+        with self._lock:
+            cart = self._carts.pop(cart_id, None)
+            if cart is None or cart_id not in self._dirty:
+                return
+            self._dirty.discard(cart_id)
+            try:
+                self._write({cart_id: dict(cart.lines)})
+            except Exception:
+                db.session.rollback()
+                self._carts[cart_id] = cart
+                self._dirty.add(cart_id)
+                raise
+
+    @staticmethod
+    def _write(snapshot):
+        """Write ``{cart_id: {product_id: quantity}}`` and commit."""
+        upserts = [
+            {"cart_id": cart_id, "product_id": product_id, "quantity": quantity}
+            for cart_id, lines in snapshot.items() for product_id, quantity in lines.items() if quantity
+        ]
+        removals = [
+            {"b_cart_id": cart_id, "b_product_id": product_id}
+            for cart_id, lines in snapshot.items() for product_id, quantity in lines.items() if not quantity
+        ]
+        # Quantities are written as absolute values, so a later flush of the
+        # same cart simply overwrites this one.
+        if upserts:
+            statement = insert(cart_items)
+            statement = statement.on_conflict_do_update(
+                index_elements=[cart_items.c.cart_id, cart_items.c.product_id],
+                set_={'quantity': statement.excluded.quantity}
+            )
+            db.session.execute(statement, upserts)
+        if removals:
+            db.session.execute(
+                delete(cart_items).where(
+                    cart_items.c.cart_id == bindparam('b_cart_id'),
+                    cart_items.c.product_id == bindparam('b_product_id')
+                ),
+                removals
+            )
+        db.session.commit()
+
+    def _evict_idle(self):
+        cutoff = time.monotonic() - self.idle_ttl
+        with self._lock:
+            for cart_id in [cart_id for cart_id, cart in self._carts.items() if cart.touched < cutoff]:
+                if cart_id not in self._dirty:
+                    del self._carts[cart_id]
+
+
+def make_cart_store(kind):
+    if kind == 'memory':
+        return MemoryCartStore(app.config['CART_IDLE_TTL'])
+    if kind == 'sql':
+        return SQLCartStore()
+    raise ValueError(f'Unknown CART_STORE {kind!r}')
+
+
+cart_store = make_cart_store(app.config['CART_STORE'])
+
+
+@schedule('CART_FLUSH_INTERVAL')
+def flush_carts_job():
+    cart_store.flush()
+
+
+@atexit.register
+def flush_carts_at_exit():
+    with app.app_context():
+        cart_store.flush()
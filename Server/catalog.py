@@ -0,0 +1,258 @@
+import base64
+import json
+
+from sqlalchemy import and_, case, func, literal, or_, union_all
+from sqlalchemy.orm import joinedload
+
+from config import app, db, select
+from models import Product, ProductCategory, ProductRating, Review
+from projection import row_to_dict
+from ratings import HIDDEN_REVIEW_STATUSES, rating_to_dict
+
+FILTER_PARAMS = ('min_price', 'max_price', 'in_stock', 'category', 'seller', 'min_rating')
+
+# sort name -> (column, descending)
+SORTS = {
+    'id': (Product.id, False),
+    'price': (Product.price, False),
+    '-price': (Product.price, True),
+    'name': (Product.name, False),
+    'newest': (Product.id, True),
+    'rating': (ProductRating.rating_average, True),
+}
+
+PRICE_BUCKETS = (0, 25, 50, 100, 500)
+
+EXPANSIONS = ('category', 'reviews', 'rating')
+
+# Everything that changes a /products page; other query parameters are
+# ignored, so they cannot mint new ETags or cache entries.
+PAGE_PARAMS = ('fields', 'after', 'limit', 'sort', 'facets', *FILTER_PARAMS)
+
+
+class CatalogError(ValueError):
+    pass
+
+
+def _number(args, name):
+    value = args.get(name)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise CatalogError(f'{name} must be a number')
+
+
+def _flag(args, name):
+    value = args.get(name)
+    if value is None:
+        return None
+    return value.lower() in ('1', 'true', 'yes')
+
+
+def encode_cursor(value, last_id):
+    payload = json.dumps([value, last_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        value, last_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return value, int(last_id)
+    except (ValueError, TypeError):
+        raise CatalogError('Invalid cursor')
+
+
+def keyset_after(column, descending, value, last_id):
+    """Rows strictly after ``(value, last_id)`` in ``ORDER BY column, id``.
+
+    SQLite sorts NULLs first ascending and last descending, so a NULL sort
+    value needs its own branch to keep pages contiguous.
+    """
+    if column is Product.id:
+        return Product.id < last_id if descending else Product.id > last_id
+    if descending:
+        if value is None:
+            return and_(column.is_(None), Product.id < last_id)
+        return or_(column < value, and_(column == value, Product.id < last_id), column.is_(None))
+    if value is None:
+        return or_(and_(column.is_(None), Product.id > last_id), column.isnot(None))
+    return or_(column > value, and_(column == value, Product.id > last_id))
+
+
+class CatalogQuery:
+    """Filters, sort order and cursor parsed from the /products query string."""
+
+    def __init__(self, args):
+        self.sort = args.get('sort', 'id')
+        if self.sort not in SORTS:
+            raise CatalogError(f"sort must be one of {', '.join(SORTS)}")
+        self.sort_column, self.descending = SORTS[self.sort]
+        self.facets = _flag(args, 'facets')
+        # Requests with none of these get the original bare-array response.
+        self.paged = any(name in args for name in ('after', 'limit', 'sort', 'facets', *FILTER_PARAMS))
+        self.uses_ratings = self.sort == 'rating' or 'min_rating' in args
+        # Which rows match, and the stock facet, depend on every product's stock.
+        self.uses_stock = 'in_stock' in args or bool(self.facets)
+        self.conditions = self._conditions(args)
+        self.cursor = self._cursor(args.get('after'))
+
+    def _conditions(self, args):
+        conditions = []
+        min_price = _number(args, 'min_price')
+        max_price = _number(args, 'max_price')
+        if min_price is not None:
+            conditions.append(Product.price >= min_price)
+        if max_price is not None:
+            conditions.append(Product.price <= max_price)
+
+        in_stock = _flag(args, 'in_stock')
+        if in_stock is True:
+            conditions.append(Product.quantity > 0)
+        elif in_stock is False:
+            conditions.append(or_(Product.quantity <= 0, Product.quantity.is_(None)))
+
+        if args.get('category'):
+            conditions.append(Product.id.in_(
+                select(ProductCategory.product_id).where(ProductCategory.name == args['category'])
+            ))
+        if args.get('seller'):
+            seller = args.get('seller', type=int)
+            if seller is None:
+                raise CatalogError('seller must be a user id')
+            conditions.append(Product.user_id == seller)
+
+        min_rating = _number(args, 'min_rating')
+        if min_rating is not None:
+            conditions.append(ProductRating.rating_average >= min_rating)
+        return conditions
+
+    def _cursor(self, after):
+        if after is None:
+            return None
+        if self.sort_column is Product.id:
+            try:
+                return None, int(after)
+            except ValueError:
+                raise CatalogError('Invalid cursor')
+        return decode_cursor(after)
+
+    def _ordering(self):
+        if self.descending:
+            return self.sort_column.desc(), Product.id.desc()
+        return self.sort_column.asc(), Product.id.asc()
+
+    def _from(self, query):
+        if self.uses_ratings:
+            return query.select_from(Product).outerjoin(ProductRating, ProductRating.product_id == Product.id)
+        return query
+
+    def select(self, columns):
+        query = self._from(select(*columns, self.sort_column.label('sort_key')))
+        query = query.where(*self.conditions).order_by(*self._ordering())
+        if self.cursor is not None:
+            query = query.where(keyset_after(self.sort_column, self.descending, *self.cursor))
+        return query
+
+    def page(self, columns, limit):
+        rows = db.session.execute(self.select(columns).limit(limit + 1)).all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            if self.sort_column is Product.id:
+                next_cursor = last.id
+            else:
+                next_cursor = encode_cursor(last.sort_key, last.id)
+        return {
+            'products': [self.to_dict(row) for row in rows[:limit]],
+            'next_cursor': next_cursor
+        }
+
+    @staticmethod
+    def to_dict(row):
+        product = row_to_dict(row)
+        product.pop('sort_key', None)
+        return product
+
+    def facet_counts(self):
+        """Category, stock and price-band counts over the filtered catalog in one statement."""
+        filtered = self._from(select(Product.id, Product.price, Product.quantity)).where(*self.conditions).cte('filtered')
+
+        bands = [
+            (filtered.c.price < upper, f'{lower}-{upper}')
+            for lower, upper in zip(PRICE_BUCKETS, PRICE_BUCKETS[1:])
+        ]
+        band = case(*bands, else_=f'{PRICE_BUCKETS[-1]}+')
+        stock = case((filtered.c.quantity > 0, 'in_stock'), else_='out_of_stock')
+
+        statement = union_all(
+            select(literal('category').label('facet'), ProductCategory.name.label('value'), func.count().label('count'))
+            .select_from(filtered.join(ProductCategory, ProductCategory.product_id == filtered.c.id))
+            .group_by(ProductCategory.name),
+            select(literal('stock'), stock, func.count()).select_from(filtered).group_by(stock),
+            select(literal('price'), band, func.count()).select_from(filtered)
+            .where(filtered.c.price.isnot(None)).group_by(band),
+        )
+
+        facets = {'category': {}, 'stock': {}, 'price': {}}
+        for facet, value, count in db.session.execute(statement):
+            facets[facet][value] = count
+        return facets
+
+
+def parse_expand(value):
+    names = {name.strip() for name in (value or '').split(',') if name.strip()}
+    unknown = names - set(EXPANSIONS)
+    if unknown:
+        raise CatalogError(f"expand must be a subset of {', '.join(EXPANSIONS)}")
+    return names
+
+
+def detail_to_dict(product):
+    return {
+        "id": product.id,
+        "name": product.name,
+        "price": product.price,
+        "description": product.description,
+        "quantity": product.quantity
+    }
+
+
+def product_detail(product_id, expand, reviews_limit):
+    """Product page payload: the product, its categories and rating stats
+    come back in one statement, the latest reviews in one bounded query."""
+    query = select(Product).where(Product.id == product_id)
+    if 'category' in expand:
+        query = query.options(joinedload(Product.category))
+    if 'rating' in expand:
+        query = query.add_columns(ProductRating).outerjoin(ProductRating, ProductRating.product_id == Product.id)
+
+    row = db.session.execute(query).unique().first()
+    if row is None:
+        return None
+
+    product = row[0]
+    response = detail_to_dict(product)
+    if 'category' in expand:
+        response['category'] = [{"id": category.id, "name": category.name} for category in product.category]
+    if 'rating' in expand:
+        response['rating'] = rating_to_dict(row.ProductRating)
+    if 'reviews' in expand:
+        reviews = db.session.execute(
+            select(Review.id, Review.user_id, Review.rating, Review.review, Review.date, Review.status)
+            .where(Review.product_id == product_id, Review.status.notin_(HIDDEN_REVIEW_STATUSES))
+            .order_by(Review.date.desc(), Review.id.desc())
+            .limit(reviews_limit)
+        )
+        response['reviews'] = [row_to_dict(review) for review in reviews]
+    return response
+
+
+def page_params(args):
+    return tuple((name, args.get(name)) for name in PAGE_PARAMS if name in args)
+
+
+def page_size(limit):
+    return min(max(limit or app.config['PRODUCT_PAGE_SIZE'], 1), app.config['PRODUCT_PAGE_MAX'])
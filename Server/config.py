@@ -1,5 +1,6 @@
-from flask import Flask, request, make_response, jsonify
-from sqlalchemy import MetaData
+from flask import Flask, request, make_response, jsonify, Response, stream_with_context
+from sqlalchemy import MetaData, select, text
+from sqlalchemy.orm.exc import StaleDataError
 from flask_migrate import Migrate
 from flask_restful import Api, Resource
 from flask_sqlalchemy import SQLAlchemy
@@ -15,16 +16,77 @@ app = Flask(__name__)
 metadata = MetaData()
 db = SQLAlchemy(metadata=metadata)
 
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///whimsy.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('SQLALCHEMY_DATABASE_URI', 'sqlite:///whimsy.db')
 app.config['SECRET_KEY'] = '49b77a70efb919bcf7d37b1b05c7d149'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['JWT_SECRET_KEY'] = b'\x9d~\xaejx\xfe\xc5\xa1\xf6\xaa\x31\xdb\xb0k\xf7\x9d'
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=72)
 app.config['JWT_COOKIE_SECURE'] = False
+app.config['PROPAGATE_EXCEPTIONS'] = True
+app.config['PRODUCT_PAGE_SIZE'] = 50
+app.config['PRODUCT_PAGE_MAX'] = 500
+app.config['PRODUCT_CACHE_SIZE'] = 10000
+app.config['CATALOG_CACHE_SIZE'] = 256
+app.config['PRODUCT_CACHE_TTL'] = 300
+app.config['TABLE_VERSION_TTL'] = 1
+app.config['SEARCH_PAGE_SIZE'] = 20
+app.config['BULK_CHUNK_SIZE'] = 500
+app.config['REVIEWS_EXPAND_LIMIT'] = 5
+app.config['BACKGROUND_JOBS_ENABLED'] = True
+app.config['TOKEN_REVOCATION_REFRESH'] = 1
+app.config['TOKEN_BLOCKLIST_PURGE_INTERVAL'] = 3600
+app.config['USER_CACHE_SIZE'] = 10000
+app.config['USER_CACHE_TTL'] = 300
+app.config['BCRYPT_LOG_ROUNDS'] = 12
+app.config['PASSWORD_POOL_WORKERS'] = 2
+app.config['PASSWORD_POOL_MAX_PENDING'] = 16
+app.config['RESERVATION_TTL'] = 900
+app.config['RESERVATION_MAX_RETRIES'] = 10
+app.config['RESERVATION_SWEEP_INTERVAL'] = 30
+app.config['ORDER_PAGE_SIZE'] = 20
+app.config['ORDER_PAGE_MAX'] = 100
+app.config['ADMIN_USERNAMES'] = set()
+app.config['SALES_BACKFILL_CHUNK'] = 1000
+app.config['SALES_REPORT_DAYS'] = 30
+app.config['SALES_REPORT_ROWS'] = 100
+app.config['OUTBOX_DISPATCH_INTERVAL'] = 2
+app.config['OUTBOX_BATCH_SIZE'] = 500
+app.config['OUTBOX_MAX_ATTEMPTS'] = 5
+app.config['IDEMPOTENCY_TTL'] = 86400
+app.config['IDEMPOTENCY_CACHE_SIZE'] = 10000
+app.config['IDEMPOTENCY_WAIT'] = 10
+app.config['IDEMPOTENCY_LEASE'] = 60
+app.config['IDEMPOTENCY_PURGE_INTERVAL'] = 3600
+app.config['CART_STORE'] = 'sql'
+app.config['CART_FLUSH_INTERVAL'] = 5
+app.config['CART_IDLE_TTL'] = 600
+app.config['INBOX_PAGE_SIZE'] = 20
+app.config['INBOX_PAGE_MAX'] = 100
+app.config['STREAM_MAX_PER_WORKER'] = 50
+app.config['STREAM_HEARTBEAT'] = 15
+app.config['STREAM_POLL_INTERVAL'] = 1
+app.config['STREAM_RETRY_MS'] = 3000
+app.config['STREAM_BATCH_SIZE'] = 100
+app.config['RETENTION_INTERVAL'] = None
+app.config['RETENTION_CHUNK_SIZE'] = 500
+app.config['RETENTION_VACUUM'] = False
+app.config['RETENTION_VACUUM_PAGES'] = 1000
+app.config['RETENTION_READ_NOTIFICATION_DAYS'] = 30
+app.config['RETENTION_NOTIFICATION_DAYS'] = 180
+app.config['RETENTION_NOTIFICATIONS_PER_USER'] = 500
+app.config['RETENTION_PENDING_ADDRESS_DAYS'] = 90
+app.config['RETENTION_OUTBOX_DAYS'] = 7
+app.config['RETENTION_RESERVATION_DAYS'] = 7
 
 db.init_app(app)
-migrate = Migrate(app,db)
+
+def include_object(object, name, type_, reflected, compare_to):
+    # The FTS5 search index and its shadow tables are managed by hand in
+    # migrations, so autogenerate must not try to drop them.
+    return not (type_ == 'table' and name.startswith('products_fts'))
+
+migrate = Migrate(app, db, include_object=include_object)
 jwt = JWTManager(app)
 api = Api(app)
 bcrypt = Bcrypt(app)
-CORS(app)
\ No newline at end of file
+CORS(app, expose_headers=['X-Next-Cursor'])
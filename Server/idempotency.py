@@ -0,0 +1,197 @@
+import hashlib
+import threading
+import time
+from functools import wraps
+
+from sqlalchemy import delete, update
+from sqlalchemy.dialects.sqlite import insert as upsert
+
+from config import app, db, select, datetime, timedelta, request, make_response, jsonify, Response, get_jwt_identity
+from models import IdempotencyKey
+from cache import LRUCache
+from scheduler import schedule
+
+keys = IdempotencyKey.__table__
+
+HEADER = 'Idempotency-Key'
+
+# scoped key -> (fingerprint, status_code, body, mimetype) of finished requests
+completed = LRUCache(app.config['IDEMPOTENCY_CACHE_SIZE'], app.config['IDEMPOTENCY_TTL'])
+
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+
+class _Conflict(Exception):
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+
+def _identity():
+    try:
+        return get_jwt_identity() or ''
+    except RuntimeError:
+        return ''
+
+
+def _scoped_key(key):
+    return f'{request.method} {request.path} {_identity()} {key}'
+
+
+def _fingerprint():
+    return hashlib.sha256(request.get_data()).hexdigest()
+
+
+def _window_start():
+    return datetime.utcnow() - timedelta(seconds=app.config['IDEMPOTENCY_TTL'])
+
+
+def _replay(entry):
+    _, status_code, body, mimetype = entry
+    response = Response(body, status=status_code, mimetype=mimetype)
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _to_response(rv):
+    if isinstance(rv, Response):
+        return rv
+    if isinstance(rv, tuple):
+        return make_response(jsonify(rv[0]), *rv[1:])
+    return make_response(jsonify(rv))
+
+
+def _claim(scoped, fingerprint):
+    """Record ``scoped`` as in flight. Returns None once this request owns the
+    key, or the stored response if another request already finished it."""
+    deadline = time.monotonic() + app.config['IDEMPOTENCY_WAIT']
+    while True:
+        result = db.session.execute(
+            upsert(keys)
+            .values(key=scoped, fingerprint=fingerprint, created_at=datetime.utcnow())
+            .on_conflict_do_nothing(index_elements=[keys.c.key])
+        )
+        if result.rowcount:
+            db.session.commit()
+            return None
+
+        row = db.session.execute(
+            select(keys.c.fingerprint, keys.c.status_code, keys.c.body, keys.c.mimetype, keys.c.created_at)
+            .where(keys.c.key == scoped)
+        ).first()
+        if row is None:
+            db.session.rollback()
+            continue
+        abandoned = row.status_code is None and \
+            row.created_at < datetime.utcnow() - timedelta(seconds=app.config['IDEMPOTENCY_LEASE'])
+        if abandoned or row.created_at < _window_start():
+            # A key from outside the window, or a claim whose owner died
+            # mid-request: start over as if it had never been used.
+            db.session.execute(delete(keys).where(keys.c.key == scoped, keys.c.created_at == row.created_at))
+            db.session.commit()
+            continue
+        db.session.rollback()
+
+        if row.fingerprint != fingerprint:
+            raise _Conflict(f'{HEADER} was already used for a different request', 422)
+        if row.status_code is not None:
+            return tuple(row)[:4]
+        # Another worker process is running it; poll until it finishes.
+        if time.monotonic() > deadline:
+            raise _Conflict(f'A request with this {HEADER} is still in progress', 409)
+        time.sleep(0.05)
+
+
+def idempotent(view):
+    """Run a write at most once per ``Idempotency-Key``.
+
+    The first response is stored in ``idempotency_keys`` and an in-memory
+    LRU and replayed for retries with the same key for ``IDEMPOTENCY_TTL``
+    seconds. A retry that arrives while the original is still running waits
+    for it instead of executing again. Server errors are not stored, so they
+    can be retried.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view(*args, **kwargs)
+
+        scoped = _scoped_key(key)
+        fingerprint = _fingerprint()
+
+        while True:
+            entry = completed.get(scoped)
+            if entry is not None:
+                if entry[0] != fingerprint:
+                    return make_response(jsonify({"error": f'{HEADER} was already used for a different request'}), 422)
+                return _replay(entry)
+
+            with _in_flight_lock:
+                running = _in_flight.get(scoped)
+                if running is None:
+                    running = _in_flight[scoped] = threading.Event()
+                    break
+            if not running.wait(app.config['IDEMPOTENCY_WAIT']):
+                return make_response(jsonify({"error": f'A request with this {HEADER} is still in progress'}), 409)
+
+        try:
+            try:
+                stored = _claim(scoped, fingerprint)
+            except _Conflict as e:
+                return make_response(jsonify({"error": str(e)}), e.status)
+            if stored is not None:
+                completed.set(scoped, stored)
+                return _replay(stored)
+
+            try:
+                response = _to_response(view(*args, **kwargs))
+            except Exception:
+                db.session.rollback()
+                db.session.execute(delete(keys).where(keys.c.key == scoped))
+                db.session.commit()
+                raise
+
+            if response.status_code >= 500:
+                db.session.execute(delete(keys).where(keys.c.key == scoped))
+            else:
+                entry = (fingerprint, response.status_code, response.get_data(), response.mimetype)
+                db.session.execute(
+                    update(keys).where(keys.c.key == scoped)
+                    .values(status_code=entry[1], body=entry[2], mimetype=entry[3])
+                )
+                completed.set(scoped, entry)
+            db.session.commit()
+            return response
+        finally:
+            with _in_flight_lock:
+                _in_flight.pop(scoped, None)
+            running.set()
+
+    return wrapper
+
+
+def purge_idempotency_keys(chunk_size=1000):
+    """Delete keys older than IDEMPOTENCY_TTL in small batches."""
+    cutoff = _window_start()
+    purged = 0
+    while True:
+        expired = select(keys.c.key).where(keys.c.created_at < cutoff).limit(chunk_size)
+        result = db.session.execute(delete(keys).where(keys.c.key.in_(expired)))
+        db.session.commit()
+        purged += result.rowcount
+        if result.rowcount < chunk_size:
+            break
+    return purged
+
+
+@schedule('IDEMPOTENCY_PURGE_INTERVAL')
+def purge_idempotency_keys_job():
+    purge_idempotency_keys()
+
+
+@app.cli.command('purge-idempotency-keys')
+def purge_idempotency_keys_command():
+    """Delete idempotency keys older than IDEMPOTENCY_TTL."""
+    print(f'Purged {purge_idempotency_keys()} idempotency key(s).')
@@ -0,0 +1,79 @@
+from sqlalchemy import and_, or_, update
+
+from config import app, db, select, datetime
+from models import Notification, NotificationCounter
+from catalog import CatalogError, encode_cursor, decode_cursor
+from projection import row_to_dict
+
+notifications = Notification.__table__
+
+INBOX_COLUMNS = (
+    Notification.id, Notification.title, Notification.content, Notification.created_at,
+    Notification.status, Notification.type, Notification.read
+)
+
+
+class InboxError(ValueError):
+    pass
+
+
+def unread_count(user_id):
+    """The badge count: one primary-key read of the trigger-maintained counter."""
+    count = db.session.execute(
+        select(NotificationCounter.unread).where(NotificationCounter.user_id == user_id)
+    ).scalar()
+    return count or 0
+
+
+def inbox_page(user_id, after=None, limit=None, unread_only=False):
+    """One page of a user's notifications, newest first, paged on
+    (created_at, id). The (user_id, created_at, id) index returns the full
+    listing in order and (user_id, read, created_at) the unread one, so
+    neither has to sort all of the user's notifications."""
+    limit = min(max(limit or app.config['INBOX_PAGE_SIZE'], 1), app.config['INBOX_PAGE_MAX'])
+    query = (
+        select(*INBOX_COLUMNS)
+        .where(Notification.user_id == user_id)
+        .order_by(Notification.created_at.desc(), Notification.id.desc())
+        .limit(limit + 1)
+    )
+    if unread_only:
+        query = query.where(Notification.read.is_(False))
+    if after:
+        try:
+            created_at, last_id = decode_cursor(after)
+            created_at = datetime.fromisoformat(created_at)
+        except (CatalogError, TypeError, ValueError):
+            raise InboxError('Invalid cursor')
+        query = query.where(or_(
+            Notification.created_at < created_at,
+            and_(Notification.created_at == created_at, Notification.id < last_id)
+        ))
+
+    rows = db.session.execute(query).all()
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor(last.created_at.isoformat(), last.id)
+    return {
+        "notifications": [row_to_dict(row) for row in rows[:limit]],
+        "next_cursor": next_cursor,
+        "unread": unread_count(user_id)
+    }
+
+
+def mark_read(user_id, from_id=None, to_id=None):
+    """Mark the user's unread notifications with ids in ``[from_id, to_id]``
+    as read in one UPDATE; open bounds mean no limit on that side."""
+    statement = (
+        update(notifications)
+        .where(notifications.c.user_id == user_id, notifications.c.read.is_(False))
+        .values(read=True)
+    )
+    if from_id is not None:
+        statement = statement.where(notifications.c.id >= from_id)
+    if to_id is not None:
+        statement = statement.where(notifications.c.id <= to_id)
+    result = db.session.execute(statement)
+    db.session.commit()
+    return result.rowcount
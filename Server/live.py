@@ -0,0 +1,141 @@
+import threading
+
+from sqlalchemy import func
+
+from config import app, db, select
+from models import Notification
+from inbox import INBOX_COLUMNS
+from projection import row_to_dict
+from scheduler import schedule
+
+
+class StreamLimitReached(Exception):
+    pass
+
+
+class NotificationHub:
+    """In-process fan-out for live notification streams.
+
+    Messages are wake-ups rather than payloads: a woken stream reads
+    everything after the last id it sent from the notifications table, so it
+    never misses or reorders rows however it was woken.
+    """
+
+    def __init__(self, max_streams):
+        self.max_streams = max_streams
+        self._subscribers = {}
+        self._count = 0
+        self._high_water = None
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        with self._lock:
+            if self._count >= self.max_streams:
+                raise StreamLimitReached()
+            wakeup = threading.Event()
+            self._subscribers.setdefault(user_id, set()).add(wakeup)
+            self._count += 1
+            return wakeup
+
+    def unsubscribe(self, user_id, wakeup):
+        with self._lock:
+            waiting = self._subscribers.get(user_id)
+            if waiting and wakeup in waiting:
+                waiting.discard(wakeup)
+                self._count -= 1
+                if not waiting:
+                    del self._subscribers[user_id]
+
+    def publish(self, *user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                for wakeup in self._subscribers.get(user_id, ()):
+                    wakeup.set()
+
+    def poll(self):
+        """Wake streams for notifications written by other workers: one grouped
+        query per worker per interval, however many streams are open."""
+        with self._lock:
+            if not self._subscribers:
+                self._high_water = None
+                return
+            high_water = self._high_water
+        if high_water is None:
+            high_water = db.session.execute(select(func.max(Notification.id))).scalar() or 0
+        rows = db.session.execute(
+            select(Notification.user_id, func.max(Notification.id))
+            .where(Notification.id > high_water)
+            .group_by(Notification.user_id)
+        ).all()
+        db.session.rollback()
+        with self._lock:
+            self._high_water = max([high_water, *(last_id for _, last_id in rows)])
+        self.publish(*(user_id for user_id, _ in rows))
+
+
+notification_hub = NotificationHub(app.config['STREAM_MAX_PER_WORKER'])
+
+
+def _latest_id(user_id):
+    return db.session.execute(
+        select(func.max(Notification.id)).where(Notification.user_id == user_id)
+    ).scalar() or 0
+
+
+def _since(user_id, last_id, limit):
+    rows = db.session.execute(
+        select(*INBOX_COLUMNS)
+        .where(Notification.user_id == user_id, Notification.id > last_id)
+        .order_by(Notification.id)
+        .limit(limit)
+    ).all()
+    # Release the connection between reads; streams are long lived.
+    db.session.rollback()
+    return rows
+
+
+def _event(row):
+    return f"id: {row.id}\nevent: notification\ndata: {app.json.dumps(row_to_dict(row))}\n\n"
+
+
+def notification_events(user_id, last_event_id=None):
+    """Server-sent events for a user's new notifications.
+
+    Registers with the hub before the first read so nothing written in
+    between is lost; raises StreamLimitReached when the worker is full.
+    With ``last_event_id`` the stream first replays everything after it,
+    STREAM_BATCH_SIZE rows per query.
+    """
+    wakeup = notification_hub.subscribe(user_id)
+    try:
+        last_id = last_event_id if last_event_id is not None else _latest_id(user_id)
+    except Exception:
+        notification_hub.unsubscribe(user_id, wakeup)
+        raise
+
+    def generate():
+        nonlocal last_id
+        try:
+            yield f"retry: {app.config['STREAM_RETRY_MS']}\n\n"
+            wakeup.set()
+            while True:
+                if wakeup.wait(app.config['STREAM_HEARTBEAT']):
+                    wakeup.clear()
+                    while True:
+                        rows = _since(user_id, last_id, app.config['STREAM_BATCH_SIZE'])
+                        for row in rows:
+                            last_id = row.id
+                            yield _event(row)
+                        if len(rows) < app.config['STREAM_BATCH_SIZE']:
+                            break
+                else:
+                    yield ': keep-alive\n\n'
+        finally:
+            notification_hub.unsubscribe(user_id, wakeup)
+
+    return generate()
+
+
+@schedule('STREAM_POLL_INTERVAL')
+def poll_notifications_job():
+    notification_hub.poll()
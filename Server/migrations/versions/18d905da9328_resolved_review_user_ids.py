@@ -0,0 +1,33 @@
+"""resolved review user ids
+
+Revision ID: 18d905da9328
+Revises: ad7d46ea076f
+Create Date: 2026-10-18 21:04:37.518302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '18d905da9328'
+down_revision = 'ad7d46ea076f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Reviews used to store the JWT identity, a username, in user_id, and
+    # their outbox events copied it. Point them at the user's id instead;
+    # names that match no user become NULL.
+    for table in ('reviews', 'outbox_events'):
+        op.execute(f"""
+            UPDATE {table}
+            SET user_id = (SELECT users.id FROM users WHERE users.username = {table}.user_id)
+            WHERE typeof(user_id) = 'text'
+        """)
+
+
+def downgrade():
+    # The usernames are not restored; the ids are what the column declares.
+    pass
@@ -1,4 +1,5 @@
-from config import db, SerializerMixin, hybrid_property, bcrypt, datetime
+from config import db, SerializerMixin, hybrid_property, datetime
+from passwords import hash_password, check_password
 
 
 class User(db.Model, SerializerMixin):
@@ -16,11 +17,10 @@ class User(db.Model, SerializerMixin):
 
     @password_hash.setter
     def password_hash(self, password):
-        hashed_password = bcrypt.generate_password_hash(password.encode('utf-8'))
-        self._password_hash = hashed_password.decode('utf-8')
+        self._password_hash = hash_password(password)
         
     def authenticate(self, password):
-        return bcrypt.check_password_hash(self._password_hash, password.encode('utf-8'))
+        return check_password(self._password_hash, password)
 
     #Relationships
     products = db.relationship('Product', back_populates="user", lazy='dynamic')
@@ -45,8 +45,33 @@ class TokenBlocklist(db.Model, SerializerMixin):
     created_at = db.Column(db.DateTime, nullable=False)
 
 
+class TableVersion(db.Model, SerializerMixin):
+    __tablename__ = 'table_versions'
+
+    name = db.Column(db.String(), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<TableVersion {self.name}, {self.version}>'
+
+
+class StockVersion(db.Model, SerializerMixin):
+    __tablename__ = 'stock_versions'
+
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<StockVersion {self.product_id}, {self.version}>'
+
+
 class Product(db.Model, SerializerMixin):
     __tablename__ = 'products'
+    __table_args__ = (
+        db.Index('ix_products_price_id', 'price', 'id'),
+        db.Index('ix_products_user_id_price', 'user_id', 'price'),
+        db.Index('ix_products_quantity', 'quantity'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(), unique=True)
@@ -55,6 +80,11 @@ class Product(db.Model, SerializerMixin):
     quantity = db.Column(db.Integer)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     image_url = db.Column(db.String())
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    # Every ORM update checks and bumps version, so concurrent writers get a
+    # StaleDataError instead of silently overwriting each other.
+    __mapper_args__ = {'version_id_col': version}
 
     # Relationships
     user = db.relationship('User', back_populates='products', lazy=True)
@@ -71,6 +101,69 @@ class Product(db.Model, SerializerMixin):
         return f'<Product {self.name}, {self.price} of category {self.category}>'
 
 
+class InventoryReservation(db.Model, SerializerMixin):
+    __tablename__ = 'inventory_reservations'
+    __table_args__ = (
+        db.Index('ix_inventory_reservations_status_expires_at', 'status', 'expires_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    quantity = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(), nullable=False, default='held')
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<InventoryReservation {self.id}, {self.quantity} of product {self.product_id}>'
+
+
+class ProductRating(db.Model, SerializerMixin):
+    __tablename__ = 'product_ratings'
+
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), primary_key=True)
+    review_count = db.Column(db.Integer, nullable=False, default=0)
+    rating_sum = db.Column(db.Integer, nullable=False, default=0)
+    rating_average = db.Column(db.Float, index=True)
+    stars_1 = db.Column(db.Integer, nullable=False, default=0)
+    stars_2 = db.Column(db.Integer, nullable=False, default=0)
+    stars_3 = db.Column(db.Integer, nullable=False, default=0)
+    stars_4 = db.Column(db.Integer, nullable=False, default=0)
+    stars_5 = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<ProductRating {self.product_id}, {self.rating_average} from {self.review_count}>'
+
+
+class SalesDailyProduct(db.Model, SerializerMixin):
+    __tablename__ = 'sales_daily_products'
+
+    day = db.Column(db.Date, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), primary_key=True)
+    status = db.Column(db.String(), primary_key=True)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<SalesDailyProduct {self.day} product {self.product_id} {self.status}>'
+
+
+class SalesDailyUser(db.Model, SerializerMixin):
+    __tablename__ = 'sales_daily_users'
+
+    day = db.Column(db.Date, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    status = db.Column(db.String(), primary_key=True)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<SalesDailyUser {self.day} user {self.user_id} {self.status}>'
+
+
 class Cart(db.Model, SerializerMixin):
     __tablename__ = "carts"
 
@@ -89,6 +182,9 @@ class Cart(db.Model, SerializerMixin):
 
 class CartItem(db.Model, SerializerMixin):
     __tablename__ = "cart_items"
+    __table_args__ = (
+        db.Index('ix_cart_items_cart_id_product_id', 'cart_id', 'product_id', unique=True),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     cart_id = db.Column(db.Integer, db.ForeignKey('carts.id'))
@@ -105,6 +201,9 @@ class CartItem(db.Model, SerializerMixin):
 
 class Order(db.Model, SerializerMixin):
     __tablename__ = 'orders'
+    __table_args__ = (
+        db.Index('ix_orders_user_id_id', 'user_id', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
@@ -112,6 +211,7 @@ class Order(db.Model, SerializerMixin):
     quantity = db.Column(db.Integer)
     price = db.Column(db.Integer)
     status = db.Column(db.String(), nullable=False, default='pending')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     #Relationships
     user = db.relationship('User', back_populates='orders', lazy=True)
@@ -151,7 +251,7 @@ class ProductCategory(db.Model, SerializerMixin):
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(), nullable=False, unique=True)
-    product_id = db.Column(db.Integer, db.ForeignKey('products.id'))
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), index=True)
 
     #Relationships
     products = db.relationship('Product', back_populates='category', lazy=True)
@@ -165,6 +265,9 @@ class ProductCategory(db.Model, SerializerMixin):
 
 class Review(db.Model, SerializerMixin):
     __tablename__ = 'reviews'
+    __table_args__ = (
+        db.Index('ix_reviews_product_id_date', 'product_id', 'date'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
@@ -211,6 +314,10 @@ class Address(db.Model, SerializerMixin):
 
 class Notification(db.Model, SerializerMixin):
     __tablename__ = 'notifications'
+    __table_args__ = (
+        db.Index('ix_notifications_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+        db.Index('ix_notifications_user_id_read_created_at', 'user_id', 'read', 'created_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
@@ -229,3 +336,46 @@ class Notification(db.Model, SerializerMixin):
 
     def __repr__(self):
         return f'<Notification {self.id}, {self.user_id}>'
+
+
+class NotificationCounter(db.Model, SerializerMixin):
+    __tablename__ = 'notification_counters'
+
+    # Maintained by triggers on notifications; see the migration that adds it.
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    unread = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<NotificationCounter {self.user_id}, {self.unread}>'
+
+
+class OutboxEvent(db.Model, SerializerMixin):
+    __tablename__ = 'outbox_events'
+    __table_args__ = (
+        db.Index('ix_outbox_events_dispatched_at_id', 'dispatched_at', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    topic = db.Column(db.String(), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    payload = db.Column(db.JSON, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    dispatched_at = db.Column(db.DateTime)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<OutboxEvent {self.id}, {self.topic}>'
+
+
+class IdempotencyKey(db.Model, SerializerMixin):
+    __tablename__ = 'idempotency_keys'
+
+    key = db.Column(db.String(), primary_key=True)
+    fingerprint = db.Column(db.String(), nullable=False)
+    status_code = db.Column(db.Integer)
+    body = db.Column(db.LargeBinary)
+    mimetype = db.Column(db.String())
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f'<IdempotencyKey {self.key}, {self.status_code}>'
@@ -0,0 +1,162 @@
+from sqlalchemy import bindparam, insert, update
+
+from config import app, db, select, datetime
+from models import Product, Order, OrderItem
+from versions import bump_stock, bump_versions
+from sales import record_order
+from reservations import consume_holds
+from outbox import emit
+
+products = Product.__table__
+
+# Only decrements rows that still have enough stock, so concurrent checkouts
+# can never drive quantity below zero.
+decrement_stock = (
+    update(products)
+    .where(products.c.id == bindparam('b_id'), products.c.quantity >= bindparam('b_quantity'))
+    .values(quantity=products.c.quantity - bindparam('b_quantity'), version=products.c.version + 1)
+)
+
+
+class OrderError(Exception):
+    def __init__(self, message, status=400, **details):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+    def to_dict(self):
+        return {"message": str(self), **self.details}
+
+
+def parse_lines(data):
+    """Return ``{product_id: quantity}`` from ``items`` or a legacy single-product body."""
+    items = data.get('items')
+    if items is None:
+        if 'product_id' not in data:
+            raise OrderError("product_id is required")
+        items = [{"product_id": data['product_id'], "quantity": data.get('quantity', 1)}]
+    if not isinstance(items, list) or not items:
+        raise OrderError("items must be a non-empty list")
+
+    lines = {}
+    for item in items:
+        product_id = item.get('product_id') if isinstance(item, dict) else None
+        quantity = item.get('quantity', 1) if isinstance(item, dict) else None
+        if not isinstance(product_id, int) or isinstance(product_id, bool):
+            raise OrderError("Each item needs an integer product_id")
+        if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity < 1:
+            raise OrderError("Each item needs a positive integer quantity")
+        lines[product_id] = lines.get(product_id, 0) + quantity
+    return lines
+
+
+def parse_reservation_ids(data):
+    reservation_ids = data.get('reservation_ids', [])
+    if not isinstance(reservation_ids, list) or any(
+        not isinstance(reservation_id, int) or isinstance(reservation_id, bool) for reservation_id in reservation_ids
+    ):
+        raise OrderError("reservation_ids must be a list of integer ids")
+    return set(reservation_ids)
+
+
+def _take_holds(user_id, lines, reservation_ids):
+    """Consume the holds and return how many units of each line still have
+    to come out of stock."""
+    to_take = dict(lines)
+    holds = consume_holds(reservation_ids, user_id)
+    not_held = sorted(reservation_ids - {hold.id for hold in holds})
+    if not_held:
+        db.session.rollback()
+        raise OrderError("Reservation is not held", 409, reservation_ids=not_held)
+    for hold in holds:
+        to_take[hold.product_id] = to_take.get(hold.product_id, 0) - hold.quantity
+    excess = sorted(product_id for product_id, quantity in to_take.items() if quantity < 0)
+    if excess:
+        db.session.rollback()
+        raise OrderError("Reservations cover more than the order", 409, product_ids=excess)
+    return to_take
+
+
+def create_order(user_id, lines, status='pending', reservation_ids=None):
+    """Write an order for ``lines`` into the current transaction with a fixed
+    number of statements, however many lines there are. Prices come from the
+    catalog. Units covered by the user's ``reservation_ids`` are taken from
+    those holds, which are marked consumed, instead of from stock. Returns the
+    new order id; rolls the transaction back and raises OrderError if a
+    product is missing or out of stock, or a reservation is not held."""
+    rows = db.session.execute(
+        select(Product.id, Product.price, Product.quantity).where(Product.id.in_(lines))
+    ).all()
+    found = {row.id: row for row in rows}
+    missing = sorted(set(lines) - set(found))
+    if missing:
+        db.session.rollback()
+        raise OrderError("Product does not exist", 404, product_ids=missing)
+
+    to_take = _take_holds(user_id, lines, reservation_ids) if reservation_ids else lines
+    to_take = {product_id: quantity for product_id, quantity in to_take.items() if quantity}
+    if to_take:
+        result = db.session.execute(
+            decrement_stock,
+            [{"b_id": product_id, "b_quantity": quantity} for product_id, quantity in to_take.items()]
+        )
+        if result.rowcount != len(to_take):
+            db.session.rollback()
+            short = sorted(
+                product_id for product_id, quantity in to_take.items()
+                if (found[product_id].quantity or 0) < quantity
+            )
+            raise OrderError("Insufficient stock", 409, product_ids=short)
+
+    total = sum((found[product_id].price or 0) * quantity for product_id, quantity in lines.items())
+    order_id = db.session.execute(
+        insert(Order).returning(Order.id),
+        {
+            "user_id": user_id,
+            "product_id": next(iter(lines)) if len(lines) == 1 else None,
+            "quantity": sum(lines.values()),
+            "price": total,
+            "status": status,
+            "created_at": datetime.utcnow(),
+        }
+    ).scalar_one()
+    db.session.execute(
+        insert(OrderItem.__table__),
+        [
+            {
+                "order_id": order_id,
+                "product_id": product_id,
+                "quantity": quantity,
+                "price": found[product_id].price,
+                "status": status,
+            }
+            for product_id, quantity in lines.items()
+        ]
+    )
+    record_order(order_id)
+    emit('order.placed', user_id, order_id=order_id, status=status)
+    bump_stock(*lines)
+    bump_versions('orders')
+    return order_id
+
+
+def place_order(user_id, lines, status='pending', reservation_ids=None):
+    """Create and commit an order; see create_order."""
+    order_id = create_order(user_id, lines, status, reservation_ids)
+    db.session.commit()
+    return order_id
+
+
+def order_history(user_id, columns, after=None, limit=None, status=None):
+    """One keyset page of a user's orders, newest first, read backwards off
+    the (user_id, id) index."""
+    limit = min(max(limit or app.config['ORDER_PAGE_SIZE'], 1), app.config['ORDER_PAGE_MAX'])
+    query = select(*columns).where(Order.user_id == user_id).order_by(Order.id.desc()).limit(limit + 1)
+    if after is not None:
+        query = query.where(Order.id < after)
+    if status:
+        query = query.where(Order.status == status)
+    rows = db.session.execute(query).all()
+
+    next_cursor = rows[limit - 1].id if len(rows) > limit else None
+    return {"orders": rows[:limit], "next_cursor": next_cursor}
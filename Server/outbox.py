@@ -0,0 +1,175 @@
+import logging
+
+import click
+from sqlalchemy import insert, update
+from sqlalchemy.exc import SQLAlchemyError
+
+from config import app, db, select, datetime
+from models import Notification, OutboxEvent, User
+from scheduler import schedule
+from live import notification_hub
+
+logger = logging.getLogger(__name__)
+
+outbox = OutboxEvent.__table__
+notifications = Notification.__table__
+users = User.__table__
+
+# topic -> (title, content); both are formatted with the event payload.
+TOPICS = {
+    'order.placed': ('Order placed', 'Your order #{order_id} has been placed.'),
+    'order.status_changed': ('Order {new_status}', 'Your order #{order_id} is now {new_status}.'),
+    'review.status_changed': ('Review {new_status}', 'Your review #{review_id} is now {new_status}.'),
+}
+
+
+def emit(topic, user_id, **payload):
+    """Queue an event inside the caller's transaction, so it is stored if and
+    only if the change it describes is committed."""
+    if topic not in TOPICS:
+        raise ValueError(f'Unknown outbox topic {topic}')
+    db.session.execute(insert(outbox).values(
+        topic=topic,
+        user_id=user_id,
+        payload=payload,
+        created_at=datetime.utcnow(),
+        attempts=0
+    ))
+
+
+def to_notification(event, user_id):
+    title, content = TOPICS[event.topic]
+    return {
+        "user_id": user_id,
+        "title": title.format(**event.payload),
+        "content": content.format(**event.payload),
+        "created_at": event.created_at,
+        "status": 'pending',
+        "type": event.topic,
+        "read": False,
+    }
+
+
+def _resolve_users(events):
+    """Map each event's ``user_id`` to a users.id, or None when it names no
+    user. Rows written before reviews stored user ids carry a username."""
+    names = {event.user_id for event in events if isinstance(event.user_id, str)}
+    ids = {}
+    if names:
+        ids = dict(db.session.execute(
+            select(users.c.username, users.c.id).where(users.c.username.in_(names))
+        ).all())
+    return {
+        event.id: event.user_id if isinstance(event.user_id, int) else ids.get(event.user_id)
+        for event in events
+    }
+
+
+def _deliver(deliverable):
+    """Insert ``(event_id, notification)`` pairs with one executemany,
+    falling back row by row on failure; returns the ids of failed events."""
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(notifications), [notification for _, notification in deliverable])
+        return []
+    except SQLAlchemyError:
+        pass
+
+    failed = []
+    for event_id, notification in deliverable:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(notifications), notification)
+        except SQLAlchemyError:
+            logger.exception('Outbox event %s could not be delivered', event_id)
+            failed.append(event_id)
+    return failed
+
+
+def dispatch_outbox(batch_size=None):
+    """Turn pending events into notifications, one batch per transaction.
+
+    Claiming the batch and inserting its notifications commit together, so an
+    event is either delivered or still pending after a crash; replayed events
+    are delivered again (at least once). An event whose notification cannot
+    be written goes back to pending on its own, keeping its attempt, and is
+    parked once it reaches OUTBOX_MAX_ATTEMPTS. Each run passes over the
+    queue once, so a failing event is retried on the next run, not this one.
+    """
+    batch_size = batch_size or app.config['OUTBOX_BATCH_SIZE']
+    dispatched = 0
+    last_id = 0
+    while True:
+        pending = (
+            select(outbox.c.id)
+            .where(
+                outbox.c.dispatched_at.is_(None),
+                outbox.c.id > last_id,
+                outbox.c.attempts < app.config['OUTBOX_MAX_ATTEMPTS']
+            )
+            .order_by(outbox.c.id)
+            .limit(batch_size)
+        )
+        events = db.session.execute(
+            update(outbox)
+            .where(outbox.c.id.in_(pending), outbox.c.dispatched_at.is_(None))
+            .values(dispatched_at=datetime.utcnow(), attempts=outbox.c.attempts + 1)
+            .returning(outbox.c.id, outbox.c.topic, outbox.c.user_id, outbox.c.payload, outbox.c.created_at)
+        ).all()
+        if not events:
+            db.session.rollback()
+            break
+        last_id = max(event.id for event in events)
+
+        user_ids = _resolve_users(events)
+        deliverable, failed = [], []
+        for event in events:
+            if user_ids[event.id] is None:
+                continue
+            try:
+                deliverable.append((event.id, to_notification(event, user_ids[event.id])))
+            except (KeyError, IndexError, ValueError):
+                logger.exception('Outbox event %s could not be rendered', event.id)
+                failed.append(event.id)
+        if deliverable:
+            failed += _deliver(deliverable)
+        if failed:
+            db.session.execute(update(outbox).where(outbox.c.id.in_(failed)).values(dispatched_at=None))
+        db.session.commit()
+        notification_hub.publish(*{
+            notification['user_id'] for event_id, notification in deliverable if event_id not in failed
+        })
+        dispatched += len(events) - len(failed)
+    return dispatched
+
+
+def replay_outbox(from_id, to_id=None, topic=None):
+    """Mark already dispatched and parked events as pending again."""
+    statement = update(outbox).where(
+        outbox.c.id >= from_id,
+        outbox.c.dispatched_at.isnot(None) | (outbox.c.attempts >= app.config['OUTBOX_MAX_ATTEMPTS'])
+    )
+    if to_id is not None:
+        statement = statement.where(outbox.c.id <= to_id)
+    if topic:
+        statement = statement.where(outbox.c.topic == topic)
+    result = db.session.execute(statement.values(dispatched_at=None, attempts=0))
+    db.session.commit()
+    return result.rowcount
+
+
+@schedule('OUTBOX_DISPATCH_INTERVAL')
+def dispatch_outbox_job():
+    dispatch_outbox()
+
+
+@app.cli.command('replay-outbox')
+@click.option('--from-id', type=int, required=True, help='First event id to replay.')
+@click.option('--to-id', type=int, default=None, help='Last event id to replay.')
+@click.option('--topic', default=None, help='Only replay events of this topic.')
+@click.option('--dispatch/--no-dispatch', default=True, help='Dispatch right away instead of leaving it to the worker.')
+def replay_outbox_command(from_id, to_id, topic, dispatch):
+    """Re-deliver outbox events as notifications."""
+    print(f'Queued {replay_outbox(from_id, to_id, topic)} event(s) for replay.')
+    if dispatch:
+        print(f'Dispatched {dispatch_outbox()} event(s).')
@@ -0,0 +1,49 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config import app, bcrypt
+
+
+class PasswordPoolSaturated(Exception):
+    pass
+
+
+class PasswordPool:
+    """Runs bcrypt on a fixed number of threads so a burst of logins cannot
+    take every CPU from the rest of the app. Once ``max_pending`` calls are
+    already queued, new ones fail at once instead of waiting."""
+
+    def __init__(self, workers, max_pending):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+
+    def run(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            raise PasswordPoolSaturated()
+        try:
+            future = self._executor.submit(func, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result()
+
+
+password_pool = PasswordPool(app.config['PASSWORD_POOL_WORKERS'], app.config['PASSWORD_POOL_MAX_PENDING'])
+
+
+def hash_password(password):
+    return password_pool.run(bcrypt.generate_password_hash, password.encode('utf-8')).decode('utf-8')
+
+
+def check_password(password_hash, password):
+    return password_pool.run(bcrypt.check_password_hash, password_hash, password.encode('utf-8'))
+
+
+def needs_rehash(password_hash):
+    # bcrypt hashes look like $2b$<cost>$<salt+hash>
+    try:
+        cost = int(password_hash.split('$')[2])
+    except (IndexError, ValueError):
+        return True
+    return cost != app.config['BCRYPT_LOG_ROUNDS']
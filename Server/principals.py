@@ -0,0 +1,53 @@
+from collections import namedtuple
+
+from flask_jwt_extended.exceptions import UserLookupError
+from sqlalchemy import event, inspect
+
+from config import app, db, select
+from models import User
+from cache import LRUCache
+
+UserPrincipal = namedtuple('UserPrincipal', ['id', 'username', 'email'])
+
+principal_cache = LRUCache(app.config['USER_CACHE_SIZE'], app.config['USER_CACHE_TTL'])
+
+
+def load_principal(identity):
+    principal = principal_cache.get(identity)
+    if principal is None:
+        row = db.session.execute(
+            select(User.id, User.username, User.email).where(User.username == identity)
+        ).first()
+        if row is None:
+            return None
+        principal = UserPrincipal(*row)
+        principal_cache.set(identity, principal)
+    return principal
+
+
+class LazyPrincipal:
+    """Stands in for ``current_user`` and only looks the user up when an
+    attribute is first read, so endpoints that never touch it cost nothing."""
+
+    __slots__ = ('_jwt_header', '_jwt_data', '_principal')
+
+    def __init__(self, jwt_header, jwt_data):
+        self._jwt_header = jwt_header
+        self._jwt_data = jwt_data
+        self._principal = None
+
+    def __getattr__(self, name):
+        if self._principal is None:
+            self._principal = load_principal(self._jwt_data['sub'])
+            if self._principal is None:
+                identity = self._jwt_data['sub']
+                raise UserLookupError(f"Error loading the user {identity}", self._jwt_header, self._jwt_data)
+        return getattr(self._principal, name)
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def invalidate_principal(mapper, connection, target):
+    history = inspect(target).attrs.username.history
+    for username in {target.username, *history.deleted}:
+        principal_cache.pop(username)
@@ -0,0 +1,40 @@
+from config import datetime
+from models import Product, Order, Review, Address
+
+
+class FieldError(ValueError):
+    pass
+
+
+def column_map(model, names):
+    return {name: getattr(model, name) for name in names}
+
+
+PRODUCT_COLUMNS = column_map(Product, ('id', 'name', 'price', 'description', 'quantity', 'image_url'))
+ORDER_COLUMNS = column_map(Order, ('id', 'user_id', 'product_id', 'quantity', 'price', 'status'))
+REVIEW_COLUMNS = column_map(Review, ('id', 'user_id', 'product_id', 'rating', 'review', 'date', 'status'))
+ADDRESS_COLUMNS = column_map(Address, ('id', 'user_id', 'address', 'city', 'state', 'zip_code', 'country', 'phone', 'date', 'status'))
+
+
+def parse_fields(columns, fields, required=('id',)):
+    """Resolve a ``fields=a,b,c`` parameter to the columns to select.
+
+    Columns in ``required`` are always selected, e.g. the id used for keyset
+    paging. Without ``fields`` every column in ``columns`` is returned.
+    """
+    if not fields:
+        return list(columns.values())
+
+    names = [name.strip() for name in fields.split(',') if name.strip()]
+    unknown = [name for name in names if name not in columns]
+    if unknown:
+        raise FieldError(f"Unknown fields: {', '.join(unknown)}")
+    names = [*required, *names]
+    return [columns[name] for name in dict.fromkeys(names)]
+
+
+def row_to_dict(row):
+    return {
+        key: value.isoformat() if isinstance(value, datetime) else value
+        for key, value in row._mapping.items()
+    }
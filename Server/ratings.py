@@ -0,0 +1,82 @@
+from sqlalchemy import delete, func, insert as core_insert
+from sqlalchemy.dialects.sqlite import insert
+
+from config import app, db, select
+from models import ProductRating, Review
+
+product_ratings = ProductRating.__table__
+
+# Reviews in these statuses are kept but do not count towards a product's rating.
+HIDDEN_REVIEW_STATUSES = ('rejected', 'hidden')
+
+
+def is_valid_rating(value):
+    return isinstance(value, int) and not isinstance(value, bool) and 1 <= value <= 5
+
+
+def counts_toward_rating(review):
+    return review.product_id is not None and review.status not in HIDDEN_REVIEW_STATUSES
+
+
+def apply_rating(product_id, rating, sign=1):
+    """Add (``sign=1``) or remove (``sign=-1``) one review from a product's
+    stats inside the caller's transaction."""
+    stars = {f'stars_{star}': sign if star == rating else 0 for star in range(1, 6)}
+    statement = insert(product_ratings).values(
+        product_id=product_id,
+        review_count=sign,
+        rating_sum=sign * rating,
+        rating_average=rating if sign > 0 else None,
+        **stars
+    )
+    new_count = product_ratings.c.review_count + statement.excluded.review_count
+    new_sum = product_ratings.c.rating_sum + statement.excluded.rating_sum
+    statement = statement.on_conflict_do_update(
+        index_elements=[product_ratings.c.product_id],
+        set_={
+            'review_count': new_count,
+            'rating_sum': new_sum,
+            'rating_average': new_sum * 1.0 / func.nullif(new_count, 0),
+            **{name: product_ratings.c[name] + statement.excluded[name] for name in stars}
+        }
+    )
+    db.session.execute(statement)
+
+
+def rebuild_ratings():
+    """Recompute every product's stats from the reviews table in one grouped pass."""
+    grouped = select(
+        Review.product_id,
+        func.count(),
+        func.sum(Review.rating),
+        func.avg(Review.rating),
+        *(func.sum(Review.rating == star) for star in range(1, 6))
+    ).where(
+        Review.product_id.isnot(None),
+        Review.status.notin_(HIDDEN_REVIEW_STATUSES)
+    ).group_by(Review.product_id)
+
+    db.session.execute(delete(product_ratings))
+    result = db.session.execute(core_insert(product_ratings).from_select(
+        ['product_id', 'review_count', 'rating_sum', 'rating_average',
+         'stars_1', 'stars_2', 'stars_3', 'stars_4', 'stars_5'],
+        grouped
+    ))
+    db.session.commit()
+    return result.rowcount
+
+
+def rating_to_dict(rating):
+    if rating is None:
+        return {"average": None, "count": 0, "histogram": dict.fromkeys(map(str, range(1, 6)), 0)}
+    return {
+        "average": rating.rating_average,
+        "count": rating.review_count,
+        "histogram": {str(star): getattr(rating, f'stars_{star}') for star in range(1, 6)}
+    }
+
+
+@app.cli.command('rebuild-ratings')
+def rebuild_ratings_command():
+    """Recompute product_ratings from the reviews table."""
+    print(f'Rebuilt ratings for {rebuild_ratings()} products.')
@@ -0,0 +1,225 @@
+import random
+import threading
+import time
+from collections import namedtuple
+
+import click
+from sqlalchemy import bindparam, delete, func, insert, update
+
+from config import app, db, select, datetime, timedelta
+from models import Product, InventoryReservation
+from versions import bump_stock
+from scheduler import schedule
+
+products = Product.__table__
+reservations = InventoryReservation.__table__
+
+Hold = namedtuple('Hold', ['id', 'product_id', 'quantity', 'expires_at', 'attempts'])
+
+restore_stock = (
+    update(products)
+    .where(products.c.id == bindparam('b_id'))
+    .values(quantity=products.c.quantity + bindparam('b_quantity'), version=products.c.version + 1)
+)
+
+
+class ReservationError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _try_reserve(product_id, quantity, user_id, ttl, attempt):
+    """One compare-and-set attempt; returns None when another writer won."""
+    product = db.session.execute(
+        select(Product.quantity, Product.version).where(Product.id == product_id)
+    ).first()
+    if product is None:
+        raise ReservationError("Product not found", 404)
+    if (product.quantity or 0) < quantity:
+        raise ReservationError("Insufficient stock", 409)
+
+    result = db.session.execute(
+        update(products)
+        .where(products.c.id == product_id, products.c.version == product.version)
+        .values(quantity=products.c.quantity - quantity, version=products.c.version + 1)
+    )
+    if result.rowcount == 1:
+        expires_at = datetime.utcnow() + timedelta(seconds=ttl)
+        reservation_id = db.session.execute(
+            insert(reservations).returning(reservations.c.id),
+            {
+                "product_id": product_id,
+                "user_id": user_id,
+                "quantity": quantity,
+                "status": "held",
+                "created_at": datetime.utcnow(),
+                "expires_at": expires_at,
+            }
+        ).scalar_one()
+        bump_stock(product_id)
+        db.session.commit()
+        return Hold(reservation_id, product_id, quantity, expires_at, attempt)
+
+    return None
+
+
+def reserve(product_id, quantity, user_id=None, ttl=None):
+    """Hold ``quantity`` units of a product for ``ttl`` seconds.
+
+    Stock is taken with a compare-and-set on the product's version. When
+    another writer got there first the attempt is retried with jittered
+    backoff, up to RESERVATION_MAX_RETRIES times.
+    """
+    ttl = ttl or app.config['RESERVATION_TTL']
+    for attempt in range(1, app.config['RESERVATION_MAX_RETRIES'] + 1):
+        try:
+            hold = _try_reserve(product_id, quantity, user_id, ttl, attempt)
+        except Exception:
+            db.session.rollback()
+            raise
+        if hold is not None:
+            return hold
+        db.session.rollback()
+        time.sleep(random.uniform(0, 0.002 * attempt))
+
+    raise ReservationError("Too much contention on this product, please retry", 409)
+
+
+def release(reservation_id, user_id=None):
+    """Give a held reservation's stock back. Returns False if it was not held."""
+    query = update(reservations).where(reservations.c.id == reservation_id, reservations.c.status == 'held')
+    if user_id is not None:
+        query = query.where(reservations.c.user_id == user_id)
+    row = db.session.execute(
+        query.values(status='released').returning(reservations.c.product_id, reservations.c.quantity)
+    ).first()
+    if row is None:
+        db.session.rollback()
+        return False
+    db.session.execute(restore_stock, {"b_id": row.product_id, "b_quantity": row.quantity})
+    bump_stock(row.product_id)
+    db.session.commit()
+    return True
+
+
+def consume_holds(reservation_ids, user_id):
+    """Mark the user's held reservations among ``reservation_ids`` consumed
+    inside the caller's transaction and return them. Their stock already left
+    ``products.quantity`` when they were taken, so the caller must not take it
+    again."""
+    return db.session.execute(
+        update(reservations)
+        .where(
+            reservations.c.id.in_(reservation_ids),
+            reservations.c.status == 'held',
+            reservations.c.user_id == user_id
+        )
+        .values(status='consumed')
+        .returning(reservations.c.id, reservations.c.product_id, reservations.c.quantity)
+    ).all()
+
+
+def expire_reservations(chunk_size=500):
+    """Release every held reservation past its expiry, a chunk per transaction."""
+    expired = 0
+    while True:
+        due = (
+            select(reservations.c.id)
+            .where(reservations.c.status == 'held', reservations.c.expires_at < datetime.utcnow())
+            .limit(chunk_size)
+        )
+        # Flipping the status with RETURNING claims exactly the rows this
+        # transaction will restore, even if a release races with the sweep.
+        rows = db.session.execute(
+            update(reservations)
+            .where(reservations.c.id.in_(due), reservations.c.status == 'held')
+            .values(status='expired')
+            .returning(reservations.c.product_id, reservations.c.quantity)
+        ).all()
+        if not rows:
+            db.session.rollback()
+            break
+
+        restored = {}
+        for row in rows:
+            restored[row.product_id] = restored.get(row.product_id, 0) + row.quantity
+        db.session.execute(
+            restore_stock,
+            [{"b_id": product_id, "b_quantity": quantity} for product_id, quantity in restored.items()]
+        )
+        bump_stock(*restored)
+        db.session.commit()
+        expired += len(rows)
+    return expired
+
+
+@schedule('RESERVATION_SWEEP_INTERVAL')
+def expire_reservations_job():
+    expire_reservations()
+
+
+@app.cli.command('expire-reservations')
+def expire_reservations_command():
+    """Release held reservations whose TTL has passed."""
+    print(f'Released {expire_reservations()} expired reservation(s).')
+
+
+@app.cli.command('bench-reservations')
+@click.option('--threads', default=16, help='Concurrent buyers.')
+@click.option('--stock', default=1000, help='Units of the benchmark SKU.')
+@click.option('--attempts', default=100, help='Reservations each buyer tries to make.')
+def bench_reservations_command(threads, stock, attempts):
+    """Hammer one SKU from many threads and check nothing is oversold.
+
+    Runs against the configured database with a throwaway product that is
+    removed again afterwards, so point it at a development database.
+    """
+    name = f'bench-{time.time_ns()}'
+    db.session.execute(insert(products), {"name": name, "price": 1, "quantity": stock})
+    db.session.commit()
+    product_id = db.session.execute(select(Product.id).where(Product.name == name)).scalar_one()
+
+    lock = threading.Lock()
+    stats = {"held": 0, "units": 0, "sold_out": 0, "gave_up": 0, "retries": 0}
+
+    def buyer():
+        with app.app_context():
+            for _ in range(attempts):
+                try:
+                    hold = reserve(product_id, 1, ttl=600)
+                except ReservationError as e:
+                    key = 'sold_out' if str(e) == 'Insufficient stock' else 'gave_up'
+                    with lock:
+                        stats[key] += 1
+                    continue
+                with lock:
+                    stats['held'] += 1
+                    stats['units'] += hold.quantity
+                    stats['retries'] += hold.attempts - 1
+
+    workers = [threading.Thread(target=buyer) for _ in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    remaining = db.session.execute(select(Product.quantity).where(Product.id == product_id)).scalar_one()
+    held = db.session.execute(
+        select(func.coalesce(func.sum(InventoryReservation.quantity), 0))
+        .where(InventoryReservation.product_id == product_id, InventoryReservation.status == 'held')
+    ).scalar_one()
+
+    calls = threads * attempts
+    print(f'{threads} threads x {attempts} attempts on one SKU with {stock} units in {elapsed:.2f}s')
+    print(f'  throughput: {calls / elapsed:.0f} calls/s, {stats["held"] / elapsed:.0f} holds/s')
+    print(f'  holds: {stats["held"]}, sold out: {stats["sold_out"]}, gave up: {stats["gave_up"]}, retries: {stats["retries"]}')
+    print(f'  stock left: {remaining}, units held: {held}')
+    oversold = remaining < 0 or remaining + held != stock or held != stats['units']
+    print('  OVERSOLD' if oversold else '  no oversell')
+
+    db.session.execute(delete(reservations).where(reservations.c.product_id == product_id))
+    db.session.execute(delete(products).where(products.c.id == product_id))
+    db.session.commit()
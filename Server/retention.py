@@ -0,0 +1,190 @@
+import click
+from sqlalchemy import delete, func, text
+
+from config import app, db, select, datetime, timedelta
+from models import (
+    Address, IdempotencyKey, InventoryReservation, Notification, OutboxEvent, TokenBlocklist
+)
+from revocation import expiry_cutoff, purge_token_blocklist
+from idempotency import purge_idempotency_keys
+from scheduler import schedule
+
+
+def _days_ago(key):
+    return datetime.utcnow() - timedelta(days=app.config[key])
+
+
+class RetentionPolicy:
+    """Rows of ``model`` matching ``condition()`` may be deleted.
+
+    ``condition`` is called on every pass so age cut-offs move with the
+    clock. Deletes go in ``chunk_size`` batches, each its own transaction, so
+    the write lock is only ever held for one short statement.
+    """
+
+    def __init__(self, name, model, condition):
+        self.name = name
+        self.model = model
+        self.condition = condition
+
+    def count(self):
+        return db.session.execute(select(func.count()).select_from(self.model).where(self.condition())).scalar()
+
+    def purge(self, chunk_size):
+        key = self.model.__mapper__.primary_key[0]
+        purged = 0
+        while True:
+            batch = select(key).where(self.condition()).limit(chunk_size)
+            result = db.session.execute(delete(self.model).where(key.in_(batch)))
+            db.session.commit()
+            purged += result.rowcount
+            if result.rowcount < chunk_size:
+                return purged
+
+
+class DelegatedPolicy(RetentionPolicy):
+    """A policy whose purge already exists elsewhere and must keep running
+    through that code, e.g. to keep an in-memory mirror in step."""
+
+    def __init__(self, name, model, condition, purge):
+        super().__init__(name, model, condition)
+        self._purge = purge
+
+    def purge(self, chunk_size):
+        return self._purge(chunk_size=chunk_size)
+
+
+def _over_user_cap():
+    # Everything past each user's newest RETENTION_NOTIFICATIONS_PER_USER rows.
+    ranked = select(
+        Notification.id,
+        func.row_number().over(
+            partition_by=Notification.user_id,
+            order_by=(Notification.created_at.desc(), Notification.id.desc())
+        ).label('position')
+    ).where(
+        Notification.user_id.in_(
+            select(Notification.user_id).group_by(Notification.user_id)
+            .having(func.count() > app.config['RETENTION_NOTIFICATIONS_PER_USER'])
+        )
+    ).subquery()
+    return Notification.id.in_(
+        select(ranked.c.id).where(ranked.c.position > app.config['RETENTION_NOTIFICATIONS_PER_USER'])
+    )
+
+
+POLICIES = [
+    RetentionPolicy(
+        'read-notifications', Notification,
+        lambda: Notification.read.is_(True) & (Notification.created_at < _days_ago('RETENTION_READ_NOTIFICATION_DAYS'))
+    ),
+    RetentionPolicy(
+        'old-notifications', Notification,
+        lambda: Notification.created_at < _days_ago('RETENTION_NOTIFICATION_DAYS')
+    ),
+    RetentionPolicy('notifications-per-user', Notification, _over_user_cap),
+    RetentionPolicy(
+        'pending-addresses', Address,
+        lambda: (Address.status == 'pending') & (Address.date < _days_ago('RETENTION_PENDING_ADDRESS_DAYS'))
+    ),
+    RetentionPolicy(
+        'dispatched-outbox-events', OutboxEvent,
+        lambda: OutboxEvent.dispatched_at < _days_ago('RETENTION_OUTBOX_DAYS')
+    ),
+    RetentionPolicy(
+        'finished-reservations', InventoryReservation,
+        lambda: InventoryReservation.status.in_(('released', 'expired', 'consumed'))
+        & (InventoryReservation.created_at < _days_ago('RETENTION_RESERVATION_DAYS'))
+    ),
+    DelegatedPolicy(
+        'token-blocklist', TokenBlocklist,
+        lambda: TokenBlocklist.created_at < expiry_cutoff(),
+        purge_token_blocklist
+    ),
+    DelegatedPolicy(
+        'idempotency-keys', IdempotencyKey,
+        lambda: IdempotencyKey.created_at < datetime.utcnow() - timedelta(seconds=app.config['IDEMPOTENCY_TTL']),
+        purge_idempotency_keys
+    ),
+]
+
+
+def select_policies(names=None):
+    if not names:
+        return POLICIES
+    known = {policy.name: policy for policy in POLICIES}
+    unknown = [name for name in names if name not in known]
+    if unknown:
+        raise ValueError(f"Unknown retention policies: {', '.join(unknown)}")
+    return [known[name] for name in names]
+
+
+def retention_report(names=None):
+    """How many rows each policy would delete right now."""
+    return {policy.name: policy.count() for policy in select_policies(names)}
+
+
+def apply_retention(names=None, chunk_size=None):
+    chunk_size = chunk_size or app.config['RETENTION_CHUNK_SIZE']
+    return {policy.name: policy.purge(chunk_size) for policy in select_policies(names)}
+
+
+def incremental_vacuum(pages=None):
+    """Return up to ``pages`` free pages to the filesystem. Only possible once
+    the database is in auto_vacuum=INCREMENTAL mode; returns None otherwise."""
+    pages = pages or app.config['RETENTION_VACUUM_PAGES']
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        if connection.execute(text('PRAGMA auto_vacuum')).scalar() != 2:
+            return None
+        before = connection.execute(text('PRAGMA freelist_count')).scalar()
+        # The driver steps a statement that returns no columns only once and
+        # each step frees a single page, so issue one pragma per page.
+        for _ in range(min(pages, before)):
+            connection.execute(text('PRAGMA incremental_vacuum(1)'))
+        return before - connection.execute(text('PRAGMA freelist_count')).scalar()
+
+
+def convert_to_incremental_vacuum():
+    """Switch the database to auto_vacuum=INCREMENTAL. This rewrites the whole
+    file with VACUUM once, so run it during a quiet period."""
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        connection.execute(text('PRAGMA auto_vacuum = INCREMENTAL'))
+        connection.execute(text('VACUUM'))
+
+
+@schedule('RETENTION_INTERVAL')
+def retention_job():
+    apply_retention()
+    if app.config['RETENTION_VACUUM']:
+        incremental_vacuum()
+
+
+@app.cli.command('retention')
+@click.option('--dry-run', is_flag=True, help='Only report how many rows each policy would delete.')
+@click.option('--policy', 'names', multiple=True, help='Run only this policy; may be repeated.')
+@click.option('--chunk-size', type=int, default=None, help='Rows deleted per transaction.')
+@click.option('--vacuum/--no-vacuum', default=False, help='Run an incremental vacuum afterwards.')
+@click.option('--enable-incremental-vacuum', is_flag=True, help='Convert the database to auto_vacuum=INCREMENTAL first (full VACUUM).')
+def retention_command(dry_run, names, chunk_size, vacuum, enable_incremental_vacuum):
+    """Delete rows that retention policies no longer keep."""
+    try:
+        policies = select_policies(names)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--policy')
+
+    if dry_run:
+        for name, count in retention_report(names).items():
+            print(f'{name}: {count} row(s) would be deleted')
+        return
+
+    if enable_incremental_vacuum:
+        convert_to_incremental_vacuum()
+        print('Database switched to auto_vacuum=INCREMENTAL.')
+    for name, purged in apply_retention([policy.name for policy in policies], chunk_size).items():
+        print(f'{name}: deleted {purged} row(s)')
+    if vacuum:
+        freed = incremental_vacuum()
+        if freed is None:
+            print('Incremental vacuum is off for this database; rerun with --enable-incremental-vacuum.')
+        else:
+            print(f'Freed {freed} page(s).')
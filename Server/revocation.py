@@ -0,0 +1,94 @@
+import threading
+import time
+
+from sqlalchemy import delete
+
+from config import app, db, select, datetime, timezone
+from models import TokenBlocklist
+from scheduler import schedule
+
+
+class RevocationList:
+    """In-memory mirror of the unexpired rows in ``token_blocklist``.
+
+    Lookups are answered from memory. On a miss the mirror pulls rows added
+    by other workers since the last seen id, at most once every
+    ``refresh_interval`` seconds, so the cost per request does not depend on
+    how many tokens have ever been revoked.
+    """
+
+    def __init__(self, refresh_interval):
+        self.refresh_interval = refresh_interval
+        self._revoked = {}
+        self._last_id = 0
+        self._refreshed_at = None
+        self._lock = threading.Lock()
+
+    def add(self, jti, created_at):
+        with self._lock:
+            self._revoked[jti] = created_at
+
+    def refresh(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._refreshed_at is not None and now - self._refreshed_at < self.refresh_interval:
+                return
+            self._refreshed_at = now
+            rows = db.session.execute(
+                select(TokenBlocklist.id, TokenBlocklist.jti, TokenBlocklist.created_at)
+                .where(TokenBlocklist.id > self._last_id, TokenBlocklist.created_at >= expiry_cutoff())
+                .order_by(TokenBlocklist.id)
+            ).all()
+            for row in rows:
+                self._revoked[row.jti] = row.created_at
+            if rows:
+                self._last_id = rows[-1].id
+
+    def is_revoked(self, jti):
+        if jti in self._revoked:
+            return True
+        self.refresh()
+        return jti in self._revoked
+
+    def prune(self, cutoff):
+        cutoff = cutoff.replace(tzinfo=None)
+        with self._lock:
+            self._revoked = {
+                jti: created_at for jti, created_at in self._revoked.items()
+                if created_at.replace(tzinfo=None) >= cutoff
+            }
+
+
+revoked_tokens = RevocationList(app.config['TOKEN_REVOCATION_REFRESH'])
+
+
+def expiry_cutoff():
+    # Tokens issued before this point have expired on their own, so their
+    # blocklist rows no longer protect anything.
+    return datetime.now(timezone.utc) - app.config['JWT_ACCESS_TOKEN_EXPIRES']
+
+
+def purge_token_blocklist(chunk_size=1000):
+    """Delete expired blocklist rows in small batches and return how many went."""
+    cutoff = expiry_cutoff()
+    purged = 0
+    while True:
+        ids = select(TokenBlocklist.id).where(TokenBlocklist.created_at < cutoff).limit(chunk_size)
+        result = db.session.execute(delete(TokenBlocklist).where(TokenBlocklist.id.in_(ids)))
+        db.session.commit()
+        purged += result.rowcount
+        if result.rowcount < chunk_size:
+            break
+    revoked_tokens.prune(cutoff)
+    return purged
+
+
+@schedule('TOKEN_BLOCKLIST_PURGE_INTERVAL')
+def purge_token_blocklist_job():
+    purge_token_blocklist()
+
+
+@app.cli.command('purge-token-blocklist')
+def purge_token_blocklist_command():
+    """Delete token_blocklist rows older than JWT_ACCESS_TOKEN_EXPIRES."""
+    print(f'Purged {purge_token_blocklist()} expired token(s).')
@@ -0,0 +1,187 @@
+import click
+from sqlalchemy import delete, exists, func
+from sqlalchemy.dialects.sqlite import insert
+
+from config import app, db, select, datetime, timedelta
+from models import Order, OrderItem, SalesDailyProduct, SalesDailyUser
+
+daily_products = SalesDailyProduct.__table__
+daily_users = SalesDailyUser.__table__
+
+REPORT_GROUPS = ('day', 'product', 'user')
+
+
+class ReportError(ValueError):
+    pass
+
+
+def _upsert(table, key, rows):
+    """Add the grouped ``rows`` onto ``table``, creating missing buckets."""
+    statement = insert(table).from_select([*key, 'order_count', 'units', 'revenue'], rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c[name] for name in key],
+        set_={
+            name: table.c[name] + statement.excluded[name]
+            for name in ('order_count', 'units', 'revenue')
+        }
+    )
+    db.session.execute(statement)
+
+
+def _apply(condition, sign=1):
+    """Fold the orders matching ``condition`` into both rollups, or take them
+    back out with ``sign=-1``. Three grouped statements whatever the number
+    of orders, all inside the caller's transaction."""
+    day = func.date(Order.created_at)
+
+    items = (
+        select(
+            day, OrderItem.product_id, Order.status,
+            sign * func.count(func.distinct(Order.id)),
+            sign * func.sum(OrderItem.quantity),
+            sign * func.sum(OrderItem.quantity * func.coalesce(OrderItem.price, 0))
+        )
+        .join(Order, Order.id == OrderItem.order_id)
+        .where(condition, OrderItem.product_id.isnot(None))
+        .group_by(day, OrderItem.product_id, Order.status)
+    )
+    # Orders from before order_items were written carry their one product inline.
+    legacy = (
+        select(
+            day, Order.product_id, Order.status,
+            sign * func.count(),
+            sign * func.sum(Order.quantity),
+            sign * func.sum(func.coalesce(Order.price, 0))
+        )
+        .where(
+            condition,
+            Order.product_id.isnot(None),
+            ~exists().where(OrderItem.order_id == Order.id)
+        )
+        .group_by(day, Order.product_id, Order.status)
+    )
+    users = (
+        select(
+            day, Order.user_id, Order.status,
+            sign * func.count(),
+            sign * func.sum(func.coalesce(Order.quantity, 0)),
+            sign * func.sum(func.coalesce(Order.price, 0))
+        )
+        .where(condition, Order.user_id.isnot(None))
+        .group_by(day, Order.user_id, Order.status)
+    )
+
+    _upsert(daily_products, ('day', 'product_id', 'status'), items)
+    _upsert(daily_products, ('day', 'product_id', 'status'), legacy)
+    _upsert(daily_users, ('day', 'user_id', 'status'), users)
+
+
+def record_order(order_id):
+    _apply(Order.id == order_id)
+
+
+def unrecord_order(order_id):
+    """Take an order out of the rollups before it is changed or deleted;
+    follow with record_order once the change is flushed."""
+    _apply(Order.id == order_id, sign=-1)
+
+
+def backfill_sales(chunk_size=None):
+    """Rebuild both rollups from the orders table, ``chunk_size`` orders per
+    transaction. Orders placed while this runs are above the starting high
+    water mark and are counted incrementally instead."""
+    chunk_size = chunk_size or app.config['SALES_BACKFILL_CHUNK']
+
+    db.session.execute(delete(daily_products))
+    db.session.execute(delete(daily_users))
+    high_water = db.session.execute(select(func.max(Order.id))).scalar() or 0
+    db.session.commit()
+
+    processed = 0
+    last_id = 0
+    while last_id < high_water:
+        upper = min(last_id + chunk_size, high_water)
+        _apply(Order.id.between(last_id + 1, upper))
+        db.session.commit()
+        processed += db.session.execute(
+            select(func.count()).where(Order.id.between(last_id + 1, upper))
+        ).scalar()
+        last_id = upper
+    return processed
+
+
+def _parse_day(value, default):
+    if not value:
+        return default
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise ReportError('Dates must be YYYY-MM-DD')
+
+
+def sales_report(args):
+    """Totals and one breakdown for a date range, read only from the rollups."""
+    today = datetime.utcnow().date()
+    end = _parse_day(args.get('to'), today)
+    start = _parse_day(args.get('from'), end - timedelta(days=app.config['SALES_REPORT_DAYS'] - 1))
+    if start > end:
+        raise ReportError('from must not be after to')
+
+    group = args.get('group', 'day')
+    if group not in REPORT_GROUPS:
+        raise ReportError(f"group must be one of {', '.join(REPORT_GROUPS)}")
+    limit = min(max(args.get('limit', type=int) or app.config['SALES_REPORT_ROWS'], 1), app.config['SALES_REPORT_ROWS'])
+    statuses = [status.strip() for status in args.get('status', '').split(',') if status.strip()]
+
+    def scoped(table):
+        conditions = [table.c.day.between(start, end)]
+        if statuses:
+            conditions.append(table.c.status.in_(statuses))
+        return conditions
+
+    def sums(table):
+        return (
+            func.sum(table.c.order_count).label('orders'),
+            func.sum(table.c.units).label('units'),
+            func.sum(table.c.revenue).label('revenue')
+        )
+
+    # Each order lands in exactly one user bucket, so totals and daily figures
+    # come from the user rollup; per-product order counts would overlap.
+    totals = db.session.execute(select(*sums(daily_users)).where(*scoped(daily_users))).one()
+
+    if group == 'day':
+        key, table = daily_users.c.day, daily_users
+    elif group == 'product':
+        key, table = daily_products.c.product_id, daily_products
+    else:
+        key, table = daily_users.c.user_id, daily_users
+    orders, units, revenue = sums(table)
+    rows = select(key, orders, units, revenue).where(*scoped(table)).group_by(key).having(orders != 0)
+    rows = rows.order_by(key) if group == 'day' else rows.order_by(revenue.desc(), key)
+
+    return {
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "group": group,
+        "totals": {
+            "orders": totals.orders or 0,
+            "units": totals.units or 0,
+            "revenue": totals.revenue or 0
+        },
+        "rows": [
+            {**row._mapping, 'day': row.day.isoformat()} if group == 'day' else dict(row._mapping)
+            for row in db.session.execute(rows.limit(limit))
+        ]
+    }
+
+
+@app.cli.command('backfill-sales')
+@click.option('--chunk-size', type=int, default=None, help='Orders per transaction.')
+def backfill_sales_command(chunk_size):
+    """Rebuild the daily sales rollups from order history.
+
+    Status changes made to not-yet-processed orders while this runs can be
+    counted twice, so run it when order edits are quiet.
+    """
+    print(f'Rolled up {backfill_sales(chunk_size)} order(s).')
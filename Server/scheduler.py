@@ -0,0 +1,50 @@
+import logging
+import threading
+import time
+
+from config import app, db
+
+logger = logging.getLogger(__name__)
+
+_jobs = []
+_started = False
+_lock = threading.Lock()
+
+
+def schedule(interval_key):
+    """Run the decorated function every ``app.config[interval_key]`` seconds
+    on a daemon thread. A falsy interval leaves the job disabled."""
+    def decorator(func):
+        _jobs.append((interval_key, func))
+        return func
+    return decorator
+
+
+def _run(interval, func):
+    while True:
+        time.sleep(interval)
+        with app.app_context():
+            try:
+                func()
+            except Exception:
+                logger.exception('Background job %s failed', func.__name__)
+                db.session.rollback()
+
+
+@app.before_request
+def start_background_jobs():
+    # Started lazily from the first request so that CLI commands such as
+    # `flask db upgrade` never spin up workers against a half-migrated schema.
+    global _started
+    if _started:
+        return
+    with _lock:
+        if _started:
+            return
+        _started = True
+        if not app.config['BACKGROUND_JOBS_ENABLED']:
+            return
+        for interval_key, func in _jobs:
+            interval = app.config.get(interval_key)
+            if interval:
+                threading.Thread(target=_run, args=(interval, func), name=func.__name__, daemon=True).start()
@@ -0,0 +1,26 @@
+import re
+
+from config import db, text
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+SEARCH_QUERY = text("""
+    SELECT products.id, products.name, products.price, products.description,
+           products.quantity, products.image_url,
+           bm25(products_fts, 10.0, 1.0) AS rank
+    FROM products_fts
+    JOIN products ON products.id = products_fts.rowid
+    WHERE products_fts MATCH :match
+    ORDER BY rank
+    LIMIT :limit OFFSET :offset
+""")
+
+
+def build_match(query):
+    """Turn free text into an FTS5 expression that ANDs every term as a prefix."""
+    tokens = TOKEN_PATTERN.findall(query or '')
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def search_products(match, limit, offset):
+    return db.session.execute(SEARCH_QUERY, {"match": match, "limit": limit, "offset": offset}).all()
@@ -0,0 +1,58 @@
+import os
+
+os.environ.setdefault('SQLALCHEMY_DATABASE_URI', 'sqlite://')
+
+import pytest
+from flask_migrate import upgrade
+from sqlalchemy import delete, event, insert
+
+from app import app
+from config import db
+from models import CartItem, Product
+
+
+@pytest.fixture(scope='module')
+def client():
+    app.config['BACKGROUND_JOBS_ENABLED'] = False
+    with app.app_context():
+        upgrade(directory=os.path.join(os.path.dirname(__file__), 'migrations'))
+        db.session.execute(insert(Product.__table__), [
+            {"name": f"Product {index}", "price": index, "quantity": 10} for index in range(1, 51)
+        ])
+        db.session.commit()
+    yield app.test_client()
+
+
+def fill_cart(size):
+    with app.app_context():
+        db.session.execute(delete(CartItem.__table__))
+        db.session.execute(insert(CartItem.__table__), [
+            {"cart_id": 1, "product_id": product_id, "quantity": 1} for product_id in range(1, size + 1)
+        ])
+        db.session.commit()
+
+
+def count_statements(client, path):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        response = client.get(path)
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    return response, len(statements)
+
+
+def test_cart_query_count_is_constant(client):
+    counts = {}
+    for size in (1, 20, 50):
+        fill_cart(size)
+        response, counts[size] = count_statements(client, '/userCart')
+        assert response.status_code == 200
+        assert len(response.get_json()['items']) == size
+    assert counts[1] == counts[20] == counts[50], counts
@@ -0,0 +1,133 @@
+import hashlib
+import threading
+import time
+
+from sqlalchemy import bindparam, event, func
+from sqlalchemy.dialects.sqlite import insert
+
+from config import app, db, select, request, make_response, jsonify
+from models import StockVersion, TableVersion
+
+
+def bump_versions(*names):
+    """Increment the change version of each table inside the current transaction."""
+    for name in names:
+        statement = insert(TableVersion).values(name=name, version=1).on_conflict_do_update(
+            index_elements=[TableVersion.name],
+            set_={'version': TableVersion.version + 1}
+        )
+        db.session.execute(statement)
+    db.session.info['versions_changed'] = True
+
+
+def bump_stock(*product_ids):
+    """Record a stock-only change to each product inside the current transaction.
+
+    Every change takes the next number of one sequence (the current maximum
+    plus one; SQLite's write lock serialises writers), so a worker can fetch
+    just the changes after the highest number it has seen.
+    """
+    next_version = select(func.coalesce(func.max(StockVersion.version), 0) + 1).scalar_subquery()
+    statement = insert(StockVersion).values(product_id=bindparam('b_id'), version=next_version)
+    statement = statement.on_conflict_do_update(
+        index_elements=[StockVersion.product_id],
+        set_={'version': statement.excluded.version}
+    )
+    db.session.execute(statement, [{"b_id": product_id} for product_id in dict.fromkeys(product_ids)])
+    db.session.info['versions_changed'] = True
+
+
+class Versions:
+    """An immutable view of the table and stock versions at one moment."""
+
+    def __init__(self, tables, stock, latest_stock):
+        self._tables = tables
+        self._stock = stock
+        self.latest_stock = latest_stock
+
+    def of(self, *names):
+        """Versions of ``names``; the name 'stock' stands for the latest stock change."""
+        return tuple(self.latest_stock if name == 'stock' else self._tables.get(name, 0) for name in names)
+
+    def stock_of(self, *product_ids):
+        return tuple(self._stock.get(product_id, 0) for product_id in product_ids)
+
+
+class VersionSnapshot:
+    """Process-local copy of table_versions and stock_versions.
+
+    Reads are served from memory and refreshed at most every ``ttl``
+    seconds, so ETag checks and cache hits run no statements. A commit in
+    this process that bumped a version forces a refresh on the next read;
+    other workers' writes show up within ``ttl``.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._view = Versions({}, {}, 0)
+        self._expires_at = 0
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        self._expires_at = 0
+
+    def current(self):
+        with self._lock:
+            if time.monotonic() >= self._expires_at:
+                self._refresh()
+            return self._view
+
+    def _refresh(self):
+        tables = dict(db.session.execute(select(TableVersion.name, TableVersion.version)).all())
+        changed = db.session.execute(
+            select(StockVersion.product_id, StockVersion.version)
+            .where(StockVersion.version > self._view.latest_stock)
+        ).all()
+        stock, latest_stock = self._view._stock, self._view.latest_stock
+        if changed:
+            # Copied rather than updated, so views already handed out stay as they were.
+            stock = {**stock, **dict(changed)}
+            latest_stock = max(version for _, version in changed)
+        self._view = Versions(tables, stock, latest_stock)
+        self._expires_at = time.monotonic() + self.ttl
+
+
+version_snapshot = VersionSnapshot(app.config['TABLE_VERSION_TTL'])
+
+
+@event.listens_for(db.session, 'after_commit')
+def _refresh_after_commit(session):
+    if session.info.pop('versions_changed', False):
+        version_snapshot.invalidate()
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_after_rollback(session):
+    session.info.pop('versions_changed', None)
+
+
+def current_versions():
+    return version_snapshot.current()
+
+
+def make_etag(*parts):
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def table_etag(names, *parts):
+    """Strong ETag for a representation built from ``names`` and identified by ``parts``."""
+    return make_etag(names, current_versions().of(*names), parts)
+
+
+def not_modified(etag):
+    if etag in request.if_none_match:
+        response = make_response('', 304)
+        response.set_etag(etag)
+        return response
+    return None
+
+
+def tagged_response(payload, etag):
+    response = make_response(jsonify(payload), 200)
+    response.set_etag(etag)
+    return response